@@ -0,0 +1,258 @@
+"""Time pymcaspec on synthetic files and write the results as JSON.
+
+Usage::
+
+    python benchmarks/run.py --scans 50 500 5000 --output results.json
+    python benchmarks/run.py --scans 500 --compare results.json
+
+Each benchmark is timed as the best of --repeat runs and its peak
+traced memory is measured in a separate run. The import of pymcaspec is
+checked against a time budget and a list of modules it must not load,
+and the exit status is 1 if the budget is exceeded.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import synthetic
+from pymcaspec.pymcaspec import scan, specfile
+from pymcaspec.utils import bin_RIXS, calculate_energy_per_pixel, get_merixE
+
+# Modules a plain import pymcaspec must not load
+HEAVY_MODULES = ['matplotlib', 'PyMca5', 'scipy', 'h5py']
+IMPORT_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import pymcaspec
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'modules': sorted(sys.modules)}))
+"""
+
+
+def time_call(func, repeat, min_time=0.05):
+    """Best time per call, looping quick functions for at least min_time"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 10
+    best = elapsed/number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start)/number)
+    return best
+
+
+def peak_memory(func):
+    """Peak bytes traced while func runs"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def check_import(max_seconds):
+    """Time import pymcaspec in a fresh interpreter
+
+    Returns
+    -------
+    result : dict
+        'seconds', 'modules' count, 'heavy_modules' loaded and 'passed'
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(BENCHMARK_DIR)]
+        + [p for p in [env.get('PYTHONPATH')] if p])
+    best = None
+    for _ in range(3):
+        output = subprocess.run([sys.executable, '-c', IMPORT_CODE],
+                                env=env, check=True, capture_output=True,
+                                text=True).stdout
+        found = json.loads(output.splitlines()[-1])
+        if best is None or found['seconds'] < best['seconds']:
+            best = found
+    heavy = sorted({name.split('.')[0] for name in best['modules']}
+                   & set(HEAVY_MODULES))
+    return {'name': 'import', 'seconds': best['seconds'],
+            'modules': len(best['modules']), 'heavy_modules': heavy,
+            'max_seconds': max_seconds,
+            'passed': best['seconds'] <= max_seconds and not heavy}
+
+
+def benchmarks(paths, nscans, myt_points):
+    """(name, function, items per call, unit) for one dataset"""
+    spec, myt = paths['spec'], paths['myt'][0]
+    cache_dir = os.path.join(os.path.dirname(spec), 'index_cache')
+    specfile(spec, cache_dir=cache_dir)
+    F = specfile(spec, index_cache=False)
+    S = F[1:nscans + 1]
+    G = specfile(myt, index_cache=False)
+    central_Es = get_merixE(G)
+    central_Ms = G.columns('i2')[0]
+    mythen_dataset = G.get_all_MCA()
+    energy_per_pixel = calculate_energy_per_pixel(**synthetic.ANALYZER)
+    W = specfile(paths['wide'], index_cache=False)
+    wide_points = 100*nscans
+
+    return [
+        ('open', lambda: specfile(spec, index_cache=False), nscans, 'scans'),
+        ('open_cached', lambda: specfile(spec, cache_dir=cache_dir), nscans,
+         'scans'),
+        ('keys', F.keys, nscans, 'scans'),
+        ('getitem_slice', lambda: F[1:nscans + 1], nscans, 'scans'),
+        # a new scan each time, so the block is built before the column
+        # is taken
+        ('scan_index', lambda: scan(S.dataobjects).index('i2'),
+         len(S.index('i2')), 'points'),
+        # one column of a 40 column scan against loading the whole scan
+        ('columns_wide', lambda: W.columns('c3'), wide_points, 'points'),
+        ('load_wide', lambda: W['1.1'], wide_points, 'points'),
+        ('get_all_MCA', lambda: specfile(myt, index_cache=False
+                                         ).get_all_MCA(), myt_points,
+         'spectra'),
+        ('get_merixE', lambda: get_merixE(specfile(myt, index_cache=False)),
+         myt_points, 'spectra'),
+        ('bin_RIXS', lambda: bin_RIXS(central_Es, central_Ms, mythen_dataset,
+                                      synthetic.MAGICCHANNEL,
+                                      energy_per_pixel), myt_points,
+         'spectra'),
+    ]
+
+
+def run(scales, repeat=3, myt_points=None, directory=None, only=None):
+    """Run the benchmarks at each scale
+
+    Parameters
+    ----------
+    scales : list of integers
+        Numbers of scans in the main file, and of readouts in the MYT
+        file unless myt_points is given
+    repeat : integer
+        Timing repeats, the best is kept
+    myt_points : integer or None
+        Readouts in the MYT file at every scale
+    directory : string or None
+        Where the synthetic files are written. A temporary directory if
+        None.
+    only : list of strings or None
+        Names of the benchmarks to run. All if None.
+
+    Returns
+    -------
+    results : list of dict
+        'name', 'scans', 'seconds' per call, 'throughput' in 'unit'
+        per second and 'peak_bytes'
+    """
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='pymcaspec-bench-')
+    results = []
+    for nscans in scales:
+        points = nscans if myt_points is None else myt_points
+        paths = synthetic.write_dataset(directory, nscans,
+                                        myt_points=points)
+        for name, func, items, unit in benchmarks(paths, nscans, points):
+            if only and name not in only:
+                continue
+            seconds = time_call(func, repeat)
+            results.append({'name': name, 'scans': nscans,
+                            'seconds': seconds,
+                            'throughput': items/seconds, 'unit': unit,
+                            'peak_bytes': peak_memory(func)})
+            print('{:>14} {:>7} scans {:10.3g} s {:12.4g} {}/s {:8.2f} MB'
+                  .format(name, nscans, seconds, items/seconds, unit,
+                          results[-1]['peak_bytes']/1e6))
+    return results
+
+
+def environment():
+    """Versions and machine the results were taken on"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                                cwd=BENCHMARK_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def compare(results, baseline):
+    """Print the time of each benchmark relative to a previous run"""
+    before = {(r['name'], r['scans']): r for r in baseline['results']}
+    print('{:>14} {:>7} {:>10} {:>10} {:>7}'.format('name', 'scans',
+                                                    'before s', 'now s',
+                                                    'ratio'))
+    for result in results:
+        old = before.get((result['name'], result['scans']))
+        if old is not None:
+            print('{:>14} {:>7} {:10.3g} {:10.3g} {:7.2f}'.format(
+                result['name'], result['scans'], old['seconds'],
+                result['seconds'], result['seconds']/old['seconds']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark pymcaspec on synthetic spec and MYT files')
+    parser.add_argument('--scans', type=int, nargs='+', default=[50, 500],
+                        help='numbers of scans in the main file')
+    parser.add_argument('--myt-points', type=int,
+                        help='readouts in the MYT file, as many as scans '
+                             'if omitted')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='benchmarks to run')
+    parser.add_argument('--directory',
+                        help='where to write the synthetic files')
+    parser.add_argument('--max-import-seconds', type=float, default=0.5,
+                        help='budget for import pymcaspec')
+    parser.add_argument('--output', help='JSON file for the results')
+    parser.add_argument('--compare', help='JSON file of a previous run')
+    args = parser.parse_args(argv)
+
+    import_result = check_import(args.max_import_seconds)
+    print('import pymcaspec {:.3f} s, {} modules{}'.format(
+        import_result['seconds'], import_result['modules'],
+        ', loads ' + ', '.join(import_result['heavy_modules'])
+        if import_result['heavy_modules'] else ''))
+    results = run(args.scans, repeat=args.repeat,
+                  myt_points=args.myt_points, directory=args.directory,
+                  only=args.only)
+    report = {'environment': environment(), 'import': import_result,
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=1)
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(results, json.load(fh))
+    if not import_result['passed']:
+        print('import pymcaspec exceeds its budget')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""Synthetic spec and Mythen (.MYT) files for the benchmarks.
+
+The files follow the layout of the sector 27 files in examples/: a main
+file with #O/#P baseline motors and ascan data, and MYT files with one
+scan per Mythen readout holding the merixE #PN/#PV pair and a 1280
+channel @A spectrum of a Gaussian elastic line as in
+examples/fake_data.ipynb.
+"""
+import os
+
+import numpy as np
+
+NCHANNELS = 1280
+MAGICCHANNEL = 1050.5
+# d spacing of Si (1 1 7) in A, analyzer radius in mm and edge in keV
+ANALYZER = dict(d=5.4309/np.sqrt(51), R=1000, energy_edge=8.333)
+REFERENCE_E = 8.335
+LINE_WIDTH = 10e-5
+MOTORS_PER_LINE = 8
+# Names of the first baseline motors, the rest are numbered
+MOTOR_NAMES = ['Two Theta', 'Theta', 'Chi', 'Phi', 'athv', 'athh',
+               'WBS_bot', 'WBS_top', 'WBS_in', 'WBS_out', 'wbsvg', 'wbsvc',
+               'wbshg', 'wbshc', 'pzt', 'chan1', 'KohzuE', 'MMonoE',
+               'merixE', 'hhlmth', 'flag', 'hhlmyaw', 'hhlmch2', 'hhlmx2']
+SCAN_LABELS = ['Theta', 'H', 'K', 'L', 'Epoch', 'Seconds', 'i0', 'i2',
+               'mycntr', 'pin1', 'pin2', 'fluo1']
+MYT_LABELS = ['sec', 'mon', 'i0h1', 'i0h2', 'i0v1', 'i0v2', 'i0h',
+              'i0hpos', 'i0v', 'i0vpos', 'i0', 'mmepin1', 'mmepin2', 'i2',
+              'mycntr', 'mycntr2', 'mycntr3', 'pin1', 'pin2', 'ccio',
+              'fluo1', 'lockin']
+
+
+def motor_names(nmotors):
+    """Baseline motor names, realistic ones first then numbered"""
+    names = MOTOR_NAMES[:nmotors]
+    names += ['mot{}'.format(i) for i in range(len(names), nmotors)]
+    return names
+
+
+def _file_header(name):
+    return ['#F {}'.format(name),
+            '#E 1521480966',
+            '#D Fri Mar 23 11:06:36 2018',
+            '#C benchmark  User = rixs']
+
+
+def _wrapped(tag, values, per_line):
+    """#O/#P style lines with per_line values each"""
+    return ['#{}{} {}'.format(tag, i // per_line,
+                              ' '.join(values[i:i + per_line]))
+            for i in range(0, len(values), per_line)]
+
+
+def write_spec_file(path, nscans, npoints=21, nmotors=184, seed=0):
+    """Write a main spec file of ascans with baseline motors
+
+    Parameters
+    ----------
+    path : string
+        File to write
+    nscans : integer
+        Number of scans
+    npoints : integer
+        Points per scan
+    nmotors : integer
+        Baseline motors in #O and #P lines
+    seed : integer
+        Seed of the random counts
+    """
+    rng = np.random.default_rng(seed)
+    names = motor_names(nmotors)
+    lines = _file_header(os.path.basename(path))
+    lines += _wrapped('O', ['{:>9}'.format(name) for name in names],
+                      MOTORS_PER_LINE)
+    lines.append('')
+    base = rng.uniform(-10, 10, nmotors)
+    theta = np.linspace(20, 24, npoints)
+    for number in range(1, nscans + 1):
+        motors = base + 0.01*number
+        hkl = np.array([1.4, 0.2, 22.9]) + 0.001*number
+        lines += ['#S {}  ascan  Theta 20 24  {} 1'.format(number,
+                                                           npoints - 1),
+                  '#D Fri Mar 23 11:06:36 2018',
+                  '#T 1  (Seconds)',
+                  '#Q {:g} {:g} {:g}'.format(*hkl)]
+        lines += _wrapped('P', ['{:.6g}'.format(m) for m in motors],
+                          MOTORS_PER_LINE)
+        lines += ['#N {}'.format(len(SCAN_LABELS)),
+                  '#L ' + '  '.join(SCAN_LABELS)]
+        counts = rng.poisson(1000, (npoints, len(SCAN_LABELS) - 6))
+        for i in range(npoints):
+            lines.append(' '.join(
+                ['{:.6g}'.format(theta[i])]
+                + ['{:g}'.format(v) for v in hkl]
+                + ['{:.3f}'.format(i*1.05), '1']
+                + [str(c) for c in counts[i]]))
+        lines.append('')
+    with open(path, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+
+
+def mythen_spectrum(central_E, energy_per_pixel, rng, amplitude=200,
+                    background=0.5):
+    """Poisson counts of a Gaussian elastic line on the Mythen channels"""
+    channels = np.arange(1, NCHANNELS + 1)
+    energies = (MAGICCHANNEL - channels)*energy_per_pixel + central_E
+    line = amplitude*np.exp(-0.5*((energies - REFERENCE_E)/LINE_WIDTH)**2)
+    return rng.poisson(line + background)
+
+
+def write_myt_file(path, npoints=45, scan_number=1, seed=0):
+    """Write a Mythen file with one scan and @A spectrum per readout
+
+    Parameters
+    ----------
+    path : string
+        File to write
+    npoints : integer
+        Number of readouts, each a scan with merixE in #PN/#PV
+    scan_number : integer
+        Scan of the main file given in the #S lines
+    seed : integer
+        Seed of the random counts
+    """
+    from pymcaspec.utils import calculate_energy_per_pixel
+
+    rng = np.random.default_rng(seed)
+    energy_per_pixel = calculate_energy_per_pixel(**ANALYZER)
+    central_Es = np.linspace(8.334, 8.336, npoints)
+    name = os.path.basename(path)
+    lines = _file_header(name)
+    lines.append('')
+    for point, central_E in enumerate(central_Es):
+        spectrum = [str(c) for c in mythen_spectrum(central_E,
+                                                    energy_per_pixel, rng)]
+        lines += ['#S {} mythen_save Point:{} Scan:{} Datafile:{}'.format(
+                      point + 1, point, scan_number, name.split('.')[0]),
+                  '#D Fri Mar 23 11:54:47 2018',
+                  '#T 20 (Seconds)',
+                  '#Q 3.34618 1.01375 -9.34952',
+                  '#PS 1',
+                  '#PN merixE  ',
+                  '#PV {:.6g} '.format(central_E),
+                  '#@MCA %25C',
+                  '#@CHANN {} 0 {} 1'.format(NCHANNELS, NCHANNELS - 1),
+                  '#@CTIME 20 ',
+                  '#N {}'.format(len(MYT_LABELS)),
+                  '#L ' + '  '.join(MYT_LABELS) + '  ',
+                  '  '.join(['20', '0'] + ['{:g}'.format(v) for v in
+                                           rng.uniform(1e6, 1e7, 20)]),
+                  '@A ' + '\\\n '.join(' '.join(spectrum[i:i + 25])
+                                       for i in range(0, NCHANNELS, 25)),
+                  '']
+    with open(path, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+
+
+def write_wide_file(path, npoints, ncolumns=40, seed=0):
+    """Write a spec file with one scan of many counter columns
+
+    Parameters
+    ----------
+    path : string
+        File to write
+    npoints : integer
+        Points of the scan
+    ncolumns : integer
+        Columns of the scan, named c0, c1, ...
+    seed : integer
+        Seed of the random counts
+    """
+    rng = np.random.default_rng(seed)
+    labels = ['c{}'.format(i) for i in range(ncolumns)]
+    lines = _file_header(os.path.basename(path))
+    lines += ['',
+              '#S 1  timescan  1 0',
+              '#D Fri Mar 23 11:06:36 2018',
+              '#T 1  (Seconds)',
+              '#N {}'.format(ncolumns),
+              '#L ' + '  '.join(labels)]
+    values = rng.uniform(0, 1e6, (npoints, ncolumns))
+    with open(path, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+        np.savetxt(fh, values, fmt='%.6g')
+
+
+def write_dataset(directory, nscans, npoints=21, nmotors=184,
+                  myt_points=45, myt_files=1, seed=0):
+    """Write a main file and MYT files named as at sector 27, and a
+    file with one wide scan of 100 points per scan of the main file
+
+    Returns
+    -------
+    paths : dict
+        'spec' the main file, 'myt' the list of MYT files and 'wide'
+        the wide scan
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, 'bench{}'.format(nscans))
+    write_spec_file(stem, nscans, npoints=npoints, nmotors=nmotors,
+                    seed=seed)
+    myt = []
+    for number in range(1, myt_files + 1):
+        path = '{}.scan{}.MYT'.format(stem, number)
+        write_myt_file(path, npoints=myt_points, scan_number=number,
+                       seed=seed + number)
+        myt.append(path)
+    wide = stem + '.wide'
+    write_wide_file(wide, 100*nscans, seed=seed)
+    return {'spec': stem, 'myt': myt, 'wide': wide}
@@ -0,0 +1,246 @@
+import re
+
+import numpy as np
+
+from pymcaspec.specindex import split_labels
+
+
+# Header lines collected into the table
+HEADER_PATTERN = re.compile(rb'^#(?:PV|PN|X|Q|T|D|P\d+)\b[^\n]*', re.M)
+
+
+def to_float(value):
+    """Float of a header value, NaN if it is not a number"""
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def x_temperatures(xs):
+    """Temperatures written on the #X line, as read by utils.get_T_ISR
+
+    Parameters
+    ----------
+    xs : list or array of strings
+        Text after #X of each scan, e.g. ' 10.02 K 10.51'
+
+    Returns
+    -------
+    TB : array
+        The B temperature sensor, the first value
+    TA : array
+        The A temperature sensor, the third value
+    Missing values are NaN.
+    """
+    TB = np.full(len(xs), np.nan)
+    TA = np.full(len(xs), np.nan)
+    for row, x in enumerate(xs):
+        values = x.split(' ')[1:4:2]
+        if len(values) == 2:
+            TB[row] = to_float(values[0])
+            TA[row] = to_float(values[1])
+    return TB, TA
+
+
+def collect_header_lines(spec_index, positions):
+    """Header table lines of many scans found in one pass over their text
+
+    Only the #PN, #PV, #X, #Q, #T, #D and #P<n> lines are located, with
+    one regular expression search, so no scan data are parsed.
+
+    Parameters
+    ----------
+    spec_index : SpecIndex
+        Index of the file
+    positions : list of integers
+        Indices of the scans in file order
+
+    Returns
+    -------
+    header_lines : list of lists of strings
+        The lines of each scan in the order of positions
+    """
+    idx = spec_index
+    lines = {position: [] for position in positions}
+    if positions:
+        start, text = idx.read_range(positions)
+        matches = list(HEADER_PATTERN.finditer(text))
+        match_starts = start + np.array([m.start() for m in matches],
+                                        dtype=np.int64)
+        scan_of_match = np.searchsorted(idx.offsets, match_starts,
+                                        side='right') - 1
+        for match, match_start, position in zip(
+                matches, match_starts.tolist(), scan_of_match.tolist()):
+            if (position in lines and match_start
+                    < idx.offsets[position] + idx.lengths[position]):
+                lines[position].append(
+                    match.group().decode('utf-8', 'replace'))
+    return [lines[position] for position in positions]
+
+
+def file_header_table(spec_index):
+    """Header table of all scans of an index
+
+    See header_table_from_lines
+    """
+    idx = spec_index
+    positions = list(range(len(idx)))
+    motor_names = [idx.headers[idx.header_ids[position]]['motor_names']
+                   for position in positions]
+    return header_table_from_lines(
+        idx.keys(), collect_header_lines(idx, positions), motor_names)
+
+
+def table_rows(table, positions, keys):
+    """Rows of a header table as a table of their own
+
+    Motor and #PN columns are those of the whole table.
+
+    Parameters
+    ----------
+    table : dict
+        Table of all scans, see header_table_from_lines
+    positions : list of integers
+        Rows to take
+    keys : list of strings
+        Keys of the rows
+
+    Returns
+    -------
+    table : dict
+        See header_table_from_lines
+    """
+    positions = np.asarray(positions, dtype=np.intp)
+    return {'keys': list(keys),
+            'date': table['date'][positions],
+            'count_time': table['count_time'][positions],
+            'hkl': table['hkl'][positions],
+            'X': table['X'][positions],
+            'TB': table['TB'][positions],
+            'TA': table['TA'][positions],
+            'PV': {name: values[positions]
+                   for name, values in table['PV'].items()},
+            'motor_names': list(table['motor_names']),
+            'motor_columns': dict(table['motor_columns']),
+            'motors': table['motors'][positions]}
+
+
+def header_table_from_lines(keys, header_lines, motor_names):
+    """Collect the common header fields of many scans into arrays
+
+    Parameters
+    ----------
+    keys : list of strings
+        Scan keys, one per row of the table
+    header_lines : list of lists of strings
+        Header lines of each scan. Lines other than #PN, #PV, #X, #Q,
+        #T, #D and #P<n> are ignored.
+    motor_names : list of lists of strings
+        Names of the #P motor values of each scan, from the #O lines
+
+    Returns
+    -------
+    table : dict
+        'keys' : list of the scan keys
+        'date' : string array from #D
+        'count_time' : float array from #T
+        'hkl' : float array of shape (scans, 3) from #Q
+        'X' : string array with the text after #X
+        'TB', 'TA' : float arrays of the temperatures in #X,
+            see x_temperatures
+        'PV' : dict of #PN name to float array of the #PV values
+        'motor_names' : list of all baseline motor names
+        'motor_columns' : dict of motor name to column of 'motors'
+        'motors' : float array of shape (scans, motors) from #P lines
+    Missing values are '' or NaN.
+    """
+    nscans = len(keys)
+    dates = [''] * nscans
+    xs = [''] * nscans
+    count_time = np.full(nscans, np.nan)
+    hkl = np.full((nscans, 3), np.nan)
+    pvs = {}
+    motor_columns = {}
+    name_columns = {}
+    motor_rows = []
+
+    for row, lines in enumerate(header_lines):
+        pn_names = []
+        pv_values = []
+        motor_values = []
+        found_date = False
+        found_x = False
+        for line in lines:
+            tag, _, rest = line.partition(' ')
+            if tag[:2] == '#P' and tag[2:].isdigit():
+                motor_values.extend(rest.split())
+            elif tag == '#PN':
+                pn_names.extend(split_labels(rest))
+            elif tag == '#PV':
+                pv_values.extend(rest.split())
+            elif tag == '#D' and not found_date:
+                dates[row] = rest.strip()
+                found_date = True
+            elif tag == '#T':
+                try:
+                    count_time[row] = float(rest.split()[0])
+                except (IndexError, ValueError):
+                    pass
+            elif tag == '#Q':
+                try:
+                    values = [float(v) for v in rest.split()[:3]]
+                    hkl[row, :len(values)] = values
+                except ValueError:
+                    pass
+            elif tag == '#X' and not found_x:
+                xs[row] = line[2:]
+                found_x = True
+
+        if not pn_names and len(pv_values) == 1:
+            pn_names = ['']
+        for name, value in zip(pn_names, pv_values):
+            if name not in pvs:
+                pvs[name] = np.full(nscans, np.nan)
+            try:
+                pvs[name][row] = float(value)
+            except ValueError:
+                pass
+
+        names = motor_names[row] or []
+        if id(names) not in name_columns:
+            # scans share the motor names of their file header, so the
+            # columns are worked out once per header
+            columns = [motor_columns.setdefault(name, len(motor_columns))
+                       for name in names]
+            first = [i for i, name in enumerate(names)
+                     if names.index(name) == i]
+            name_columns[id(names)] = (names,
+                                       np.array(columns, dtype=np.intp)[first],
+                                       np.array(first, dtype=np.intp))
+        motor_rows.append((id(names), motor_values))
+
+    motors = np.full((nscans, len(motor_columns)), np.nan)
+    for row, (names_id, motor_values) in enumerate(motor_rows):
+        _, columns, first = name_columns[names_id]
+        keep = first < len(motor_values)
+        try:
+            values = np.array(motor_values, dtype=np.float64)[first[keep]]
+        except ValueError:
+            values = np.array([to_float(v) for v in motor_values])[
+                first[keep]]
+        motors[row, columns[keep]] = values
+
+    TB, TA = x_temperatures(xs)
+    table = {'keys': list(keys),
+             'date': np.array(dates, dtype=str),
+             'count_time': count_time,
+             'hkl': hkl,
+             'X': np.array(xs, dtype=str),
+             'TB': TB,
+             'TA': TA,
+             'PV': pvs,
+             'motor_names': list(motor_columns),
+             'motor_columns': motor_columns,
+             'motors': motors}
+    return table
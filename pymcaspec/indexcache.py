@@ -0,0 +1,265 @@
+import hashlib
+import os
+import stat
+import tempfile
+
+import numpy as np
+
+from pymcaspec.headertable import file_header_table, x_temperatures
+from pymcaspec.specindex import SpecIndex
+
+
+CACHE_VERSION = 2
+HEAD_BYTES = 1 << 16
+
+_INT_FIELDS = ['numbers', 'orders', 'offsets', 'lengths', 'npoints', 'nmca',
+               'header_ids']
+
+
+def _pack_strings(strings):
+    return np.frombuffer('\n'.join(strings).encode('utf-8'), dtype=np.uint8)
+
+
+def _unpack_strings(packed, count):
+    if count == 0:
+        return []
+    return packed.tobytes().decode('utf-8').split('\n')
+
+
+def _split(values, counts):
+    ends = np.cumsum(counts)
+    return [values[end - count:end] for end, count in zip(ends, counts)]
+
+
+def file_signature(filename):
+    """Identify the state of a file by size, mtime and a hash of its head
+
+    Parameters
+    ----------
+    filename : string
+        Path to the file
+
+    Returns
+    -------
+    signature : tuple
+        (size, mtime in ns, sha1 hex digest of the first HEAD_BYTES)
+    """
+    stat = os.stat(filename)
+    with open(filename, 'rb') as fh:
+        head_hash = hashlib.sha1(fh.read(HEAD_BYTES)).hexdigest()
+    return stat.st_size, stat.st_mtime_ns, head_hash
+
+
+def cache_path(filename, cache_dir=None):
+    """Location of the index cache for a spec file
+
+    Parameters
+    ----------
+    filename : string
+        Path to the spec file
+    cache_dir : string or None
+        Directory for cache files. If None the cache is a hidden sidecar
+        file next to the spec file.
+
+    Returns
+    -------
+    path : string
+        Path of the cache file
+    """
+    directory, basename = os.path.split(os.path.abspath(filename))
+    if cache_dir is None:
+        return os.path.join(directory, '.{}.pymcaspec.npz'.format(basename))
+    name_hash = hashlib.sha1(
+        os.path.abspath(filename).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir,
+                        '{}-{}.pymcaspec.npz'.format(basename, name_hash))
+
+
+def _pack_table(table):
+    """Arrays of a header table of all scans"""
+    pv_names = list(table['PV'])
+    return {'table_date': _pack_strings(table['date'].tolist()),
+            'table_count_time': table['count_time'],
+            'table_hkl': table['hkl'],
+            'table_X': _pack_strings(table['X'].tolist()),
+            'table_pv_names': _pack_strings(pv_names),
+            'table_pv': np.array([table['PV'][name] for name in pv_names]
+                                 ).reshape(len(pv_names),
+                                           len(table['keys'])).T,
+            'table_motor_names': _pack_strings(table['motor_names']),
+            'table_motors': table['motors']}
+
+
+def _unpack_table(cached, keys):
+    """Header table stored by _pack_table"""
+    nscans = len(keys)
+    pv_names = _unpack_strings(cached['table_pv_names'],
+                               cached['table_pv'].shape[1])
+    pv = cached['table_pv']
+    motor_names = _unpack_strings(cached['table_motor_names'],
+                                  cached['table_motors'].shape[1])
+    xs = _unpack_strings(cached['table_X'], nscans)
+    TB, TA = x_temperatures(xs)
+    return {'keys': keys,
+            'date': np.array(_unpack_strings(cached['table_date'], nscans),
+                             dtype=str),
+            'count_time': cached['table_count_time'],
+            'hkl': cached['table_hkl'],
+            'X': np.array(xs, dtype=str),
+            'TB': TB,
+            'TA': TA,
+            'PV': {name: pv[:, i] for i, name in enumerate(pv_names)},
+            'motor_names': motor_names,
+            'motor_columns': {name: i for i, name in enumerate(motor_names)},
+            'motors': cached['table_motors']}
+
+
+def save_index(spec_index, path, signature=None):
+    """Write a SpecIndex and the header table of its scans to a compact
+    binary cache file
+
+    The file gets the permissions of the spec file, without execute
+    bits, so that the other users who can read the data can read the
+    cache.
+
+    Parameters
+    ----------
+    spec_index : SpecIndex
+        The index to store
+    path : string
+        Path of the cache file
+    signature : tuple or None
+        File signature to store. If None it is computed from the file.
+    """
+    if signature is None:
+        signature = file_signature(spec_index.filename)
+    size, mtime_ns, head_hash = signature
+    headers = spec_index.headers
+    flat_labels = [name for names in spec_index.labels for name in names]
+    header_lines = [line for header in headers for line in header['lines']]
+    motor_names = [name for header in headers
+                   for name in header['motor_names']]
+    arrays = {field: np.asarray(getattr(spec_index, field), dtype=np.int64)
+              for field in _INT_FIELDS}
+    arrays.update(
+        version=np.array([CACHE_VERSION], dtype=np.int64),
+        signature=np.array([size, mtime_ns, spec_index.size], dtype=np.int64),
+        head_hash=_pack_strings([head_hash]),
+        commands=_pack_strings(spec_index.commands),
+        labels=_pack_strings(flat_labels),
+        label_counts=np.array([len(names) for names in spec_index.labels],
+                              dtype=np.int64),
+        header_offsets=np.array([h['offset'] for h in headers],
+                                dtype=np.int64),
+        header_lines=_pack_strings(header_lines),
+        header_line_counts=np.array([len(h['lines']) for h in headers],
+                                    dtype=np.int64),
+        motor_names=_pack_strings(motor_names),
+        motor_name_counts=np.array([len(h['motor_names']) for h in headers],
+                                   dtype=np.int64))
+    if spec_index.header_table is None:
+        spec_index.header_table = file_header_table(spec_index)
+    arrays.update(_pack_table(spec_index.header_table))
+    mode = stat.S_IMODE(os.stat(spec_index.filename).st_mode) & 0o666
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            np.savez(fh, **arrays)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_index(filename, path, signature=None):
+    """Read a SpecIndex from a cache file if it matches the spec file
+
+    Parameters
+    ----------
+    filename : string
+        Path to the spec file
+    path : string
+        Path of the cache file
+    signature : tuple or None
+        Current signature of the spec file. If None it is computed.
+
+    Returns
+    -------
+    spec_index : SpecIndex or None
+        The cached index or None if the cache is missing or stale
+    """
+    if not os.path.exists(path):
+        return None
+    if signature is None:
+        signature = file_signature(filename)
+    size, mtime_ns, head_hash = signature
+    try:
+        with np.load(path, allow_pickle=False) as cached:
+            if (cached['version'][0] != CACHE_VERSION
+                    or cached['signature'][0] != size
+                    or cached['signature'][1] != mtime_ns
+                    or _unpack_strings(cached['head_hash'], 1) != [head_hash]):
+                return None
+            spec_index = SpecIndex(filename, build=False)
+            for field in _INT_FIELDS:
+                setattr(spec_index, field, cached[field].tolist())
+            nscans = len(spec_index.numbers)
+            spec_index.size = int(cached['signature'][2])
+            spec_index.mtime_ns = mtime_ns
+            spec_index.commands = _unpack_strings(cached['commands'], nscans)
+            label_counts = cached['label_counts'].tolist()
+            spec_index.labels = _split(
+                _unpack_strings(cached['labels'], sum(label_counts)),
+                label_counts)
+            line_counts = cached['header_line_counts'].tolist()
+            name_counts = cached['motor_name_counts'].tolist()
+            lines = _split(_unpack_strings(cached['header_lines'],
+                                           sum(line_counts)), line_counts)
+            names = _split(_unpack_strings(cached['motor_names'],
+                                           sum(name_counts)), name_counts)
+            spec_index.headers = [
+                {'offset': offset, 'lines': header_lines,
+                 'motor_names': motor_names}
+                for offset, header_lines, motor_names
+                in zip(cached['header_offsets'].tolist(), lines, names)]
+            spec_index.header_table = _unpack_table(cached,
+                                                    spec_index.keys())
+    except (OSError, KeyError, ValueError):
+        return None
+    spec_index.rebuild_lookup()
+    return spec_index
+
+
+def get_index(filename, cache_dir=None):
+    """Load the index of a spec file from cache or build and cache it
+
+    A cache that cannot be written, for example in a read-only data
+    directory, is silently skipped.
+
+    Parameters
+    ----------
+    filename : string
+        Path to the spec file
+    cache_dir : string or None
+        Directory for cache files. If None a sidecar file is used.
+
+    Returns
+    -------
+    spec_index : SpecIndex
+        Index of the file
+    """
+    path = cache_path(filename, cache_dir)
+    signature = file_signature(filename)
+    spec_index = load_index(filename, path, signature)
+    if spec_index is None:
+        spec_index = SpecIndex(filename)
+        if spec_index.size == signature[0]:
+            try:
+                save_index(spec_index, path, signature)
+            except OSError:
+                pass
+    return spec_index
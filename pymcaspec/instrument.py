@@ -0,0 +1,273 @@
+"""Opt-in timing of the stages of a reduction.
+
+Functions and methods marked with timed, and blocks run in stage(),
+report their wall time and the bytes they parse or return to every
+active Recorder. With no recorder active the cost is one check of a
+list per call.
+
+A scoped Recorder, as used by specfile(instrument=True), only receives
+the events of its own thread and not those of methods of objects that
+report to another recorder or to none.
+
+Example
+--------
+with record(trace='trace.json') as recorder:
+    F = specfile('20March2018')
+    bin_RIXS(...)
+print(recorder.stats())
+"""
+import contextlib
+import functools
+import json
+import threading
+import time
+
+import numpy as np
+
+# Recorders currently receiving events from all threads
+_recorders = []
+# Scoped recorders receiving events of this thread
+_local = threading.local()
+_lock = threading.Lock()
+_NO_STAGE = contextlib.nullcontext()
+
+
+class Recorder:
+    """Call counts, cumulative wall time and bytes of each stage
+
+    Times are inclusive, so a stage called by another is counted in
+    both. A recorder receives events while it is used as a context
+    manager, which may be nested and entered from several threads.
+    """
+    def __init__(self, callback=None, keep_events=False, scoped=False):
+        """Create a recorder
+
+        Parameters
+        ----------
+        callback : function or None
+            Called with a dict 'stage', 'start', 'seconds', 'bytes' and
+            'thread' for each event
+        keep_events : bool
+            Keep all events for write_trace
+        scoped : bool
+            Only receive the events of the thread that entered it and
+            not those of methods of objects with another _recorder
+        """
+        self.callback = callback
+        self.keep_events = keep_events
+        self.scoped = scoped
+        self.events = []
+        self._totals = {}
+        self._depth = 0
+        self._origin = time.perf_counter()
+
+    def __enter__(self):
+        if self.scoped:
+            previous = _scoped_recorders()
+            _local.stack = getattr(_local, 'stack', [])
+            _local.stack.append(previous)
+            if self not in previous:
+                _local.recorders = previous + (self,)
+            return self
+        with _lock:
+            if self._depth == 0:
+                _recorders.append(self)
+            self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        if self.scoped:
+            _local.recorders = _local.stack.pop()
+            return
+        with _lock:
+            self._depth -= 1
+            if self._depth == 0:
+                _recorders.remove(self)
+
+    def add(self, stage, start, seconds, nbytes=0):
+        """Record one event of a stage"""
+        with _lock:
+            totals = self._totals.get(stage)
+            if totals is None:
+                totals = self._totals[stage] = [0, 0.0, 0]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += nbytes
+        if self.keep_events or self.callback is not None:
+            event = {'stage': stage, 'start': start, 'seconds': seconds,
+                     'bytes': nbytes, 'thread': threading.get_ident()}
+            if self.keep_events:
+                self.events.append(event)
+            if self.callback is not None:
+                self.callback(event)
+
+    def stats(self):
+        """Totals of each stage
+
+        Returns
+        -------
+        stats : dict
+            Stage name to a dict of 'calls', 'seconds' and 'bytes', in
+            order of decreasing time
+        """
+        with _lock:
+            items = [(stage, list(totals))
+                     for stage, totals in self._totals.items()]
+        items.sort(key=lambda item: -item[1][1])
+        return {stage: {'calls': calls, 'seconds': seconds, 'bytes': nbytes}
+                for stage, (calls, seconds, nbytes) in items}
+
+    def reset(self):
+        """Forget all totals and events"""
+        with _lock:
+            self._totals = {}
+            self.events = []
+
+    def write_trace(self, path):
+        """Write the kept events as a Chrome trace JSON file
+
+        The file can be opened in chrome://tracing or Perfetto.
+        """
+        trace = [{'name': event['stage'], 'ph': 'X', 'pid': 0,
+                  'tid': event['thread'],
+                  'ts': (event['start'] - self._origin)*1e6,
+                  'dur': event['seconds']*1e6,
+                  'args': {'bytes': event['bytes']}}
+                 for event in self.events]
+        with open(path, 'w') as fh:
+            json.dump({'traceEvents': trace}, fh)
+
+
+@contextlib.contextmanager
+def record(callback=None, trace=None):
+    """Record all stages run inside the block
+
+    Parameters
+    ----------
+    callback : function or None
+        Called with each event, see Recorder
+    trace : string or None
+        Chrome trace JSON file written when the block ends
+
+    Yields
+    ------
+    recorder : Recorder
+        Holds the totals, see Recorder.stats
+    """
+    recorder = Recorder(callback=callback, keep_events=trace is not None)
+    try:
+        with recorder:
+            yield recorder
+    finally:
+        if trace is not None:
+            recorder.write_trace(trace)
+
+
+def _scoped_recorders():
+    """Scoped recorders active in this thread"""
+    return getattr(_local, 'recorders', ())
+
+
+@contextlib.contextmanager
+def _scope(recorders):
+    """Replace the scoped recorders of this thread inside the block"""
+    previous = _scoped_recorders()
+    _local.recorders = recorders
+    try:
+        yield
+    finally:
+        _local.recorders = previous
+
+
+def _emit(name, start, nbytes):
+    seconds = time.perf_counter() - start
+    for recorder in list(_recorders) + list(_scoped_recorders()):
+        recorder.add(name, start, seconds, nbytes)
+
+
+def result_bytes(result):
+    """Bytes of the arrays in a result, an array or a tuple"""
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, tuple):
+        return sum(item.nbytes for item in result
+                   if isinstance(item, np.ndarray))
+    return 0
+
+
+class _Stage:
+    __slots__ = ('name', 'nbytes', 'start')
+
+    def __init__(self, name, nbytes):
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _emit(self.name, self.start, self.nbytes)
+
+
+def stage(name, nbytes=0):
+    """Context manager timing a block as a stage
+
+    Parameters
+    ----------
+    name : string
+        Stage name
+    nbytes : integer
+        Bytes the block parses
+    """
+    if not _recorders and not _scoped_recorders():
+        return _NO_STAGE
+    return _Stage(name, nbytes)
+
+
+def timed(name):
+    """Decorator timing a function as a stage
+
+    The bytes of the arrays it returns are counted.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _recorders and not _scoped_recorders():
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            nbytes = 0
+            try:
+                result = func(*args, **kwargs)
+                nbytes = result_bytes(result)
+            finally:
+                _emit(name, start, nbytes)
+            return result
+        return wrapper
+    return decorate
+
+
+def timed_method(name):
+    """Decorator timing a method as a stage
+
+    As timed, and the stage and the stages it runs are recorded by the
+    _recorder attribute of the object when it is not None, and by no
+    other scoped recorder.
+    """
+    def decorate(method):
+        timed_func = timed(name)(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            recorder = self._recorder
+            if recorder is None:
+                if _scoped_recorders():
+                    with _scope(()):
+                        return timed_func(self, *args, **kwargs)
+                if not _recorders:
+                    return method(self, *args, **kwargs)
+                return timed_func(self, *args, **kwargs)
+            with _scope((recorder,)):
+                return timed_func(self, *args, **kwargs)
+        return wrapper
+    return decorate
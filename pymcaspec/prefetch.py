@@ -0,0 +1,59 @@
+import queue
+import threading
+
+
+_DONE = object()
+
+
+def prefetch(iterable, size):
+    """Iterate in a background thread, keeping up to size items ahead
+
+    Parameters
+    ----------
+    iterable : iterable
+        Items to produce, e.g. a generator that parses scans
+    size : integer
+        Maximum number of items produced but not yet consumed
+
+    Yields
+    ------
+    item
+        The items of iterable in order. An exception raised while
+        producing is raised in the consumer at the same point.
+    """
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as error:
+            put((_DONE, error))
+        else:
+            put((_DONE, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        # stops the producer if the consumer leaves early
+        stop.set()
+        thread.join()
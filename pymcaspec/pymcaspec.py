@@ -1,8 +1,13 @@
-import PyMca5.PyMcaCore.SpecFileDataSource as SpecFileDataSource
+import contextlib
 import numpy as np
-from matplotlib import pyplot as plt
 from itertools import cycle
 
+from pymcaspec.headertable import header_table_from_lines
+from pymcaspec.instrument import Recorder, stage, timed_method
+from pymcaspec.prefetch import prefetch as prefetch_scans
+from pymcaspec.records import MotorTable, load_record
+from pymcaspec.specsource import SpecSource, to_count_dtype
+
 marker_cycle = cycle(['o', 's', 'p', 'h', 'd', 'v', '^', '>', '<'])
 
 
@@ -17,6 +22,47 @@ class scan:
             The scan contains these dataobjects/keys
         """
         self.dataobjects = [dataobject for dataobject in dataobject_list]
+        self._motor_columns = None
+        self._label_columns = None
+        self._block = None
+        self._offsets = None
+        self._block_checked = False
+        # set by an instrumented specfile, see specfile.stats
+        self._recorder = None
+
+    @timed_method('scan.build_block')
+    def _build_block(self):
+        """Store the data of all scans in one 2D array.
+
+        The data of dataobject i becomes a view of its segment
+        block[offsets[i]:offsets[i + 1]], so the data are held once.
+        Scans with different numbers of columns or 1D (MCA) data are
+        left as they are.
+        """
+        self._block_checked = True
+        datas = [dataobject.data for dataobject in self.dataobjects]
+        if (not datas or any(np.ndim(data) != 2 for data in datas)
+                or len({data.shape[1] for data in datas}) != 1):
+            return
+        offsets = np.zeros(len(datas) + 1, dtype=np.intp)
+        np.cumsum([len(data) for data in datas], out=offsets[1:])
+        if len(datas) == 1 and datas[0].flags.writeable:
+            block = datas[0]
+        else:
+            # read-only data, e.g. memory-mapped from a store, is copied
+            block = np.concatenate(datas)
+        for i, dataobject in enumerate(self.dataobjects):
+            dataobject.data = block[offsets[i]:offsets[i + 1]]
+        self._block = block
+        self._offsets = offsets
+
+    def _get_label_columns(self):
+        """Dict of label name to column, the first of repeated names"""
+        if self._label_columns is None:
+            self._label_columns = {}
+            for i, name in enumerate(self.dataobjects[0].info['LabelNames']):
+                self._label_columns.setdefault(name, i)
+        return self._label_columns
 
     def get_description(self):
         """Make string describing motors.
@@ -48,6 +94,7 @@ class scan:
     def __repr__(self):
         return self.get_description()
 
+    @timed_method('scan.index')
     def index(self, key):
         """Index a particular key (motor) from the scan.
 
@@ -60,19 +107,26 @@ class scan:
         Returns
         ----------
         datacol : numpy array
-            1D array of data corresponding to key
+            1D array of data corresponding to key. When all scans have
+            the same columns it is a view of the scan data, so changing
+            it changes the scan.
         """
+        if not self._block_checked:
+            self._build_block()
+        if isinstance(key, str):
+            index = self._get_label_columns().get(key)
+            if index is None:
+                raise IndexError("key {} not found".format(key))
+        else:
+            index = key
         try:
-            datacol = np.hstack([dataobject.data[:, key]
-                                 for dataobject in self.dataobjects])
-        except IndexError:
-            PrimaryNames = self.dataobjects[0].info['LabelNames']
-            try:
-                index = [i for i, k in enumerate(PrimaryNames) if key == k][0]
+            if self._block is not None:
+                datacol = self._block[:, index]
+            else:
                 datacol = np.hstack([dataobject.data[:, index]
-                                    for dataobject in self.dataobjects])
-            except IndexError:
-                raise IndexError("key {} not found".format(key))
+                                     for dataobject in self.dataobjects])
+        except IndexError:
+            raise IndexError("key {} not found".format(key))
 
         return datacol
 
@@ -92,10 +146,14 @@ class scan:
             for each scan in the series.
 
         """
-        MotorNames = self.dataobjects[0].info['MotorNames']
+        if self._motor_columns is None:
+            self._motor_columns = {}
+            for i, name in enumerate(self.dataobjects[0].info['MotorNames']
+                                     or []):
+                self._motor_columns.setdefault(name, i)
         try:
-            index = [i for i, k in enumerate(MotorNames) if key == k][0]
-        except IndexError:
+            index = self._motor_columns[key]
+        except KeyError:
             raise IndexError("key {} not found".format(key))
 
         if len(self.dataobjects) > 1:
@@ -113,13 +171,22 @@ class scan:
 
     def __iter__(self):
         """Iterating returns scan objects corresponding
-        to individual scans."""
-        for d in self.dataobjects:
-            yield scan([d])
+        to individual scans. They share the data block of this scan."""
+        if not self._block_checked:
+            self._build_block()
+        for i, d in enumerate(self.dataobjects):
+            S = scan([d])
+            S._recorder = self._recorder
+            if self._block is not None:
+                S._block = self._block[self._offsets[i]:self._offsets[i + 1]]
+                S._offsets = np.array([0, len(S._block)], dtype=np.intp)
+                S._block_checked = True
+            yield S
 
     def plot(self, ax=None, xkey=0, ykey=-1, monitor=None, **kwargs):
         """Create x,y plot of the scan data.
-        This creates one line per scan.
+        This creates one line per scan. For hundreds of scans
+        plot_collection is much faster.
         If xkey is not specified it is assumed to be index 0
         If ykey is not specified it is assumed to be the last index.
         label can be passed to override the legend label.
@@ -146,6 +213,7 @@ class scan:
             axis that contains the plotted data
         """
         if ax is None:
+            from matplotlib import pyplot as plt
             _, ax = plt.subplots()
 
         if isinstance(xkey, int):
@@ -165,6 +233,120 @@ class scan:
 
         return leg, art, ax
 
+    def plot_collection(self, ax=None, xkey=0, ykey=-1, monitor=None,
+                        max_points=None, color_by=None, cmap='viridis',
+                        legend=True, **kwargs):
+        """Plot all scans at once as one LineCollection.
+
+        This is much faster than plot for hundreds of scans as only one
+        artist is drawn and the legend is built once. Keys and monitor
+        are handled as in plot. Lines have no markers.
+
+        Parameters
+        ----------
+        xkey : integer or string
+            key for independent axis data
+        ykey : integer or string
+            key for depependent axis data
+        monitor : string
+            key for monitor, which is used to divide y
+        max_points : integer or None
+            Scans longer than this are reduced to the minimum and maximum
+            of y in max_points/2 equal chunks, which keeps their envelope.
+        color_by : string, array or None
+            Color the lines by this baseline motor, or by one value per
+            scan, and add a colorbar instead of a legend
+        cmap : string or matplotlib colormap
+            Colormap used with color_by
+        legend : bool
+            Add a legend with the scan keys when color_by is None
+        kwargs :
+            Key word arguments are passed to LineCollection e.g.
+            linewidths
+
+        Returns
+        --------
+        leg : matplotlib legend, colorbar or None
+            The legend or colorbar created in the plot
+        art : matplotlib LineCollection
+            The artist holding all lines
+        ax : matplotlib axis
+            axis that contains the plotted data
+        """
+        from matplotlib import pyplot as plt
+        from matplotlib.collections import LineCollection
+        from matplotlib.lines import Line2D
+
+        if ax is None:
+            _, ax = plt.subplots()
+
+        xdata = self.index(xkey)
+        ydata = self.index(ykey)
+        if isinstance(xkey, int):
+            xkey = self.dataobjects[0].info['LabelNames'][xkey]
+        if isinstance(ykey, int):
+            ykey = self.dataobjects[0].info['LabelNames'][ykey]
+        if monitor is None:
+            monitor = ''
+        else:
+            ydata = ydata / self.index(monitor)
+            monitor = "/" + monitor
+
+        offsets = np.zeros(len(self.dataobjects) + 1, dtype=np.intp)
+        np.cumsum([len(d.data) for d in self.dataobjects], out=offsets[1:])
+        segments = []
+        for start, stop in zip(offsets[:-1], offsets[1:]):
+            x, y = xdata[start:stop], ydata[start:stop]
+            if max_points is not None and len(y) > max_points:
+                keep = _min_max_points(y, max_points)
+                x, y = x[keep], y[keep]
+            segments.append(np.column_stack((x, y)))
+
+        labels = [d.info['Key'] for d in self.dataobjects]
+        if color_by is None:
+            colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+            kwargs.setdefault('colors', [colors[i % len(colors)]
+                                         for i in range(len(segments))])
+            art = LineCollection(segments, **kwargs)
+        else:
+            if isinstance(color_by, str):
+                values = np.atleast_1d(self.get_baseline(color_by))
+            else:
+                values = np.asarray(color_by)
+            art = LineCollection(segments, cmap=cmap, **kwargs)
+            art.set_array(np.asarray(values, dtype=np.float64))
+        ax.add_collection(art)
+        ax.autoscale_view()
+
+        ax.set_xlabel('{}'.format(xkey))
+        ax.set_ylabel('{}'.format(ykey+monitor))
+        if color_by is not None:
+            label = color_by if isinstance(color_by, str) else None
+            leg = ax.figure.colorbar(art, ax=ax, label=label)
+        elif legend:
+            handles = [Line2D([], [], color=color)
+                       for color in art.get_colors()]
+            leg = ax.legend(handles, labels)
+        else:
+            leg = None
+
+        return leg, art, ax
+
+    def header_table(self):
+        """Collect common header fields of the scans into arrays
+
+        Returns
+        --------
+        table : dict
+            Keys, dates, count times, hkl, #X text, #PN/#PV values and
+            baseline motors of each scan.
+            See pymcaspec.headertable.header_table_from_lines
+        """
+        return header_table_from_lines(
+            [d.info['Key'] for d in self.dataobjects],
+            [d.info['Header'] or [] for d in self.dataobjects],
+            [d.info['MotorNames'] for d in self.dataobjects])
+
     def get_hkl(self):
         """Get hkl value of scans
 
@@ -174,16 +356,17 @@ class scan:
             (h, k, l) or a list of (h, k, l) values
             depending on whether all scans have the same value.
         """
-        hkls = [d.info['hkl'] for d in self.dataobjects]
-        if all(h == hkls[0] for h in hkls):
-            hkl = hkls[0]
+        hkls = self.header_table()['hkl']
+        if np.isnan(hkls[0]).all():
+            hkl = None
         else:
+            hkl = tuple(hkls[0].tolist())
+        if not all(np.array_equal(h, hkls[0], equal_nan=True) for h in hkls):
             raise Warning("Different scans have different (h, k, l) values")
-            hkl = hkls
+            hkl = [tuple(h) for h in hkls.tolist()]
 
         return hkl
 
-
     def plot_combined(self, ax=None, xkey=0, ykey=-1, monitor=None, **kwargs):
         """Create x,y plot of the scan data.
         This creates one line.
@@ -222,6 +405,7 @@ class scan:
             ykey = self.dataobjects[0].info['LabelNames'][ykey]
 
         if ax is None:
+            from matplotlib import pyplot as plt
             _, ax = plt.subplots()
 
         if 'label' in kwargs.keys():
@@ -232,7 +416,7 @@ class scan:
         if monitor is None:
             monitor = ''
         else:
-            ydata /= self.index(monitor)
+            ydata = ydata / self.index(monitor)
             monitor = "/" + monitor
 
         if 'marker' not in kwargs.keys():
@@ -248,18 +432,156 @@ class scan:
         return leg, art, ax
 
 
+def _min_max_points(y, max_points):
+    """Indices of the minimum and maximum of y in max_points/2 chunks
+
+    Parameters
+    ----------
+    y : array
+        Values of one line
+    max_points : integer
+        Number of points to keep
+
+    Returns
+    --------
+    keep : array
+        Sorted indices, at most max_points of them
+    """
+    nchunks = max(1, max_points // 2)
+    edges = np.linspace(0, len(y), nchunks + 1).astype(np.intp)
+    chunk = np.repeat(np.arange(nchunks), np.diff(edges))
+    order = np.lexsort((y, chunk))
+    return np.unique(np.concatenate([order[edges[:-1]],
+                                     order[edges[1:] - 1]]))
+
+
 class specfile:
     """Container for specfile"""
-    def __init__(self, filename):
+    def __init__(self, filename, backend='native', index_cache=True,
+                 cache_dir=None, follow=False, workers=1,
+                 result_cache=None, compact=False, instrument=False):
         """Initialize class
 
         Parameters
         ----------
         filename : string
             Path to the spec file
+        backend : string
+            'native' indexes the file once and parses scans lazily.
+            'pymca' uses PyMca5's SpecFileDataSource, which must be
+            installed. 'store' opens a file written by to_hdf5 or a
+            directory written by to_npy.
+        index_cache : bool
+            For the native backend, store the scan index on disk and
+            reuse it until the file size, mtime or head changes.
+        cache_dir : string or None
+            Directory for the index cache. If None the cache is a hidden
+            file next to the spec file.
+        follow : bool
+            Pick up data appended to the file, e.g. during acquisition,
+            every time keys or scans are accessed. See refresh.
+        workers : integer or None
+            Default number of processes used to parse lists and slices
+            of scans. See load_many.
+        result_cache : ResultCache or None
+            Store the arrays of get_all_MCA on disk, keyed on the file
+            identity and the arguments.
+            See pymcaspec.resultcache.ResultCache
+        compact : bool
+            Load scans as pymcaspec.records.ScanRecord, which holds
+            little more than the data, instead of full dataobjects.
+            Motor values are rows of a table shared by the file and the
+            header text is read only when asked for. Not available with
+            the PyMca backend.
+        instrument : bool
+            Record call counts, time and bytes of the stages run by this
+            file and its scans. See stats.
         """
         self.filename = filename
-        self.source = SpecFileDataSource.SpecFileDataSource(filename)
+        self.backend = backend
+        self.follow = follow
+        self.workers = workers
+        self.result_cache = result_cache
+        self.compact = compact and backend != 'pymca'
+        self._motor_table = None
+        self._file_table = None
+        self._recorder = Recorder(scoped=True) if instrument else None
+        with self.recording(), stage('specfile.open'):
+            self._open(filename, backend, index_cache, cache_dir)
+            self._build_key_lookup()
+
+    def _open(self, filename, backend, index_cache, cache_dir):
+        if backend == 'native':
+            self.source = SpecSource(filename, index_cache=index_cache,
+                                     cache_dir=cache_dir)
+        elif backend == 'pymca':
+            import PyMca5.PyMcaCore.SpecFileDataSource as SpecFileDataSource
+            self.source = SpecFileDataSource.SpecFileDataSource(filename)
+            _add_pymca_doc()
+        elif backend == 'store':
+            from pymcaspec.store import StoreSource
+            self.source = StoreSource(filename)
+        else:
+            raise ValueError("backend must be 'native', 'pymca' or 'store'")
+
+    def close(self):
+        """Release the memory map and files held open by the source.
+
+        A native file is mapped again if it is used afterwards, while a
+        store cannot be read after it is closed. A specfile can also be
+        used in a with statement, which closes it at the end.
+        """
+        if self.backend != 'pymca':
+            self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self, reset=False):
+        """Call counts, time and bytes of each stage run by this file.
+
+        Only recorded if the file was opened with instrument=True.
+        Times are inclusive of the stages a stage calls.
+
+        Parameters
+        ----------
+        reset : bool
+            Start counting again after returning the totals
+
+        Returns
+        --------
+        stats : dict
+            Stage name e.g. 'specfile.index', 'source.parse',
+            'scan.index' or 'utils.bin_mythen' to a dict of 'calls',
+            'seconds' and 'bytes' parsed or returned
+        """
+        if self._recorder is None:
+            return {}
+        stats = self._recorder.stats()
+        if reset:
+            self._recorder.reset()
+        return stats
+
+    def recording(self):
+        """Context manager adding any stage run inside it to stats.
+
+        Example
+        --------
+        with F.recording():
+            E, I, M, N = bin_RIXS(...)
+        """
+        if self._recorder is None:
+            return contextlib.nullcontext()
+        return self._recorder
+
+    def _scan(self, dataobjects):
+        """scan of dataobjects reporting to the recorder of this file"""
+        S = scan(dataobjects)
+        S._recorder = self._recorder
+        return S
 
     def get_description(self):
         """Make string showing file header and number of scans
@@ -282,14 +604,75 @@ class specfile:
         keys : list
             List of all keys in the keyfile
         """
+        if self.follow:
+            self.refresh()
         return self.source.getSourceInfo()['KeyList']
 
+    @timed_method('specfile.refresh')
+    def refresh(self):
+        """Read data appended to the file since it was last indexed.
+
+        With the native backend only the new bytes are parsed: the scan
+        that was being written is extended and new scans are added.
+
+        Returns
+        -------
+        changed_keys : list
+            Keys of scans that are new or have grown
+        """
+        self._file_table = None
+        if self.backend != 'pymca':
+            changed_keys = self.source.refresh()
+        else:
+            before = self.source.getSourceInfo()
+            before = dict(zip(before['KeyList'],
+                              zip(before['NumPts'], before['NumMca'])))
+            self.source.refresh()
+            after = self.source.getSourceInfo()
+            changed_keys = [key for key, size in
+                            zip(after['KeyList'],
+                                zip(after['NumPts'], after['NumMca']))
+                            if before.get(key) != size]
+        if changed_keys:
+            self._build_key_lookup()
+        return changed_keys
+
+    def _build_key_lookup(self):
+        """Map every accepted form of a scan key to the key itself
+
+        'N.M' maps to itself, and 'N' and the integer N map to 'N.1'.
+        """
+        lookup = {}
+        numbers = set()
+        for key in self.source.getSourceInfo()['KeyList']:
+            lookup[key] = key
+            number, _, order = key.partition('.')
+            if order == '1':
+                lookup[number] = key
+                lookup[int(number)] = key
+                numbers.add(int(number))
+        self._key_lookup = lookup
+        self._scan_numbers = sorted(numbers)
+
+    def _resolve(self, key):
+        """Key 'N.M' of a scan given in any accepted form, or None"""
+        if isinstance(key, (float, np.floating)):
+            # 5.1 is the key '5.1'
+            key = str(key)
+        elif isinstance(key, (bool, np.bool_)):
+            return None
+        try:
+            return self._key_lookup.get(key)
+        except TypeError:
+            return None
+
     def __str__(self):
         return self.get_description()
 
     def __repr__(self):
         return self.get_description()
 
+    @timed_method('specfile.index')
     def index(self, key):
         """Index a particular scan file.
 
@@ -305,28 +688,295 @@ class specfile:
         dataobject : PyMCA dataobject
             A single dataobject from the specfile
         """
+        if self.follow:
+            self.refresh()
+        scan_key = self._resolve(key)
+        if scan_key is None:
+            if not _is_mca_key(key):
+                raise IndexError("key {} not found".format(key))
+            scan_key = key
+        dataobject = self._load(scan_key)
+        return dataobject
+
+    @timed_method('specfile.load_many')
+    def load_many(self, keys, workers=None):
+        """Load many scans into one scan object, parsing in parallel.
+
+        With the native backend the scan blocks are parsed concurrently
+        in a process pool. The PyMca backend loads them one by one.
+
+        Parameters
+        ----------
+        keys : list of keys
+            Scan keys as accepted by index e.g. ['5.1', 6, '7']
+        workers : integer or None
+            Number of processes. 1 parses in this process.
+            If None the workers of the specfile are used.
+
+        Returns
+        -----
+        S : instance of scan class
+            The scans in the order of keys
+        """
+        if workers is None:
+            workers = self.workers
+        if self.follow:
+            self.refresh()
+        scan_keys = self._resolve_many(keys)
+        if (self.backend == 'pymca' or self.compact
+                or any(_is_mca_key(key) for key in scan_keys)):
+            return self._scan([self._load(key) for key in scan_keys])
         try:
-            dataobject = self.source.getDataObject(key)
-        except (KeyError, AttributeError):
-            key = str(key)
-            if '.' not in key:
-                key += '.1'
+            dataobjects = self.source.get_data_objects(scan_keys,
+                                                       workers=workers)
+        except TypeError:
+            # an empty scan; raise the same error as loading one by one
+            return self._scan([self._load(key) for key in scan_keys])
+        return self._scan(dataobjects)
+
+    def _resolve_many(self, keys):
+        """Keys 'N.M' of many scans, raising one error for all missing"""
+        scan_keys = []
+        missing = []
+        for key in keys:
+            scan_key = self._resolve(key)
+            if scan_key is None:
+                if _is_mca_key(key):
+                    scan_key = key
+                else:
+                    missing.append(key)
+            scan_keys.append(scan_key)
+        if missing:
+            raise IndexError("keys {} not found".format(missing))
+        return scan_keys
+
+    def _load(self, key):
+        """Dataobject, or ScanRecord if compact, of a scan"""
+        if not self.compact or _is_mca_key(key):
+            with stage('source.getDataObject'):
+                return self.source.getDataObject(key)
+        table = self.file_table()
+        if (self._motor_table is None
+                or self._motor_table.values is not table['motors']):
+            self._motor_table = MotorTable(table['motors'],
+                                           table['motor_columns'])
+        with stage('source.load_record'):
+            return load_record(self.source, key, self._motor_table)
+
+    @timed_method('specfile.header_table')
+    def header_table(self, keys=None):
+        """Collect common header fields of many scans into arrays.
+
+        With the native backend the header lines are found in one pass
+        over the file without building any scan.
+
+        Parameters
+        ----------
+        keys : list of strings or None
+            Scan keys. All keys if None.
+
+        Returns
+        --------
+        table : dict
+            'keys', 'date', 'count_time', 'hkl' with shape (scans, 3),
+            'X' text, 'TB' and 'TA' temperatures from #X, 'PV' dict of
+            #PN name to #PV values, and
+            'motors' with shape (scans, motors) named by 'motor_names'
+            and 'motor_columns'. Missing values are NaN or ''.
+        """
+        if keys is None:
+            keys = self.keys()
+        if self.backend != 'pymca':
+            return self.source.header_table(keys)
+        # getKeyInfo reads the header without the data, so empty scans
+        # have their header too
+        infos = [self.source.getKeyInfo(key) for key in keys]
+        return header_table_from_lines(
+            keys, [info['Header'] or [] for info in infos],
+            [info['MotorNames'] for info in infos])
+
+    def file_table(self):
+        """Header table of all scans, cached until the file changes.
+
+        Returns
+        --------
+        table : dict
+            See header_table
+        """
+        keys = self.keys()
+        if self._file_table is None or self._file_table['keys'] != keys:
+            self._file_table = self.header_table(keys)
+        return self._file_table
+
+    def baseline_motors(self):
+        """Baseline (#P) motor positions of all scans.
+
+        Returns
+        --------
+        motors : array
+            Positions in shape (scans, motors), NaN where a scan has no
+            value, in the order of keys()
+        motor_columns : dict
+            Column of each motor name in motors
+        """
+        table = self.file_table()
+        return table['motors'], table['motor_columns']
+
+    @timed_method('specfile.select')
+    def select(self, command=None, atol=1e-6, **conditions):
+        """Find scans from their headers without loading any scan data.
+
+        Conditions are evaluated on arrays over all scans at once.
+
+        Parameters
+        ----------
+        command : string, list of strings or None
+            Scan type e.g. 'ascan' or ['ascan', 'mesh'], compared with
+            the first word of the #S command
+        atol : float
+            Absolute tolerance for conditions given as a single value
+        conditions :
+            name=value for baseline motors, #PN names, 'count_time',
+            the #X temperatures 'TB' and 'TA' (see utils.get_T_ISR) or
+            'hkl', 'h', 'k', 'l'. The value is a number to match within
+            atol, a (low, high) tuple where either bound may be None,
+            or a function taking the array of values and returning a
+            boolean array. For 'hkl' the value is (h, k, l).
+
+        Returns
+        --------
+        keys : list
+            Keys of the matching scans
+
+        Example
+        --------
+        F.select(command='ascan', Chi=(10, 12), TB=(None, 20))
+        """
+        table = self.file_table()
+        keys = table['keys']
+        mask = np.ones(len(keys), dtype=bool)
+        if command is not None:
+            if isinstance(command, str):
+                command = [command]
+            scan_types = np.array([(c.split() or [''])[0] for c in
+                                   self.source.getSourceInfo()['Commands']])
+            mask &= np.isin(scan_types, command)
+        for name, condition in conditions.items():
+            if name == 'hkl':
+                matches = np.isclose(table['hkl'], condition, rtol=0,
+                                     atol=atol).all(axis=1)
+                mask &= matches
+                continue
+            if name in ('h', 'k', 'l'):
+                values = table['hkl'][:, 'hkl'.index(name)]
+            elif name in ('count_time', 'TB', 'TA'):
+                values = table[name]
+            elif name in table['motor_columns']:
+                values = table['motors'][:, table['motor_columns'][name]]
+            elif name in table['PV']:
+                values = table['PV'][name]
+            else:
+                raise KeyError("{} is not a motor or header field".format(
+                    name))
+            if callable(condition):
+                mask &= np.asarray(condition(values), dtype=bool)
+            elif isinstance(condition, (tuple, list)):
+                low, high = condition
+                if low is not None:
+                    mask &= values >= low
+                if high is not None:
+                    mask &= values <= high
+            else:
+                mask &= np.isclose(values, condition, rtol=0, atol=atol)
+        return [key for key, keep in zip(keys, mask) if keep]
+
+    @timed_method('specfile.columns')
+    def columns(self, names, keys=None):
+        """Read selected scanned motors or counters from many scans.
+
+        With the native backend only the data lines of the scans are
+        converted, without building any scan, e.g. for the monitor of
+        every scan. Empty scans have no points.
+
+        Parameters
+        ----------
+        names : string, integer or list of these
+            Column labels e.g. 'i2' or column numbers starting from 0
+        keys : list of strings or None
+            Scan keys. All keys if None.
+
+        Returns
+        --------
+        values : array
+            Points of all scans one after the other, in shape (points,)
+            for a single name or (points, len(names)) for a list
+        offsets : array
+            Points of scan i are values[offsets[i]:offsets[i + 1]]
+        """
+        if keys is None:
+            keys = self.keys()
+        if self.backend != 'pymca':
+            return self.source.columns(names, keys)
+        single = not isinstance(names, (list, tuple))
+        columns = []
+        for key in keys:
             try:
-                dataobject = self.source.getDataObject(key)
-            except (KeyError, AttributeError, SyntaxError):
-                keys = self.keys()
-                found_keys = [k for k in keys if key is k]
-                if len(found_keys) == 1:
-                    dataobject = self.source.getDataObject(found_keys[0])
-                elif len(found_keys) > 1:
-                    msg = ("key {} matches multiple ".format(key) +
-                           "entries in file:\n{}".format(found_keys))
-                    raise IndexError(msg)
-                elif len(found_keys) == 0:
-                    raise IndexError("key {} not found".format(key))
-        return dataobject
+                S = self._scan([self._load(key)])
+            except TypeError:
+                # an empty scan has no points, as with the native backend
+                columns.append(np.zeros((0,) if single else (0, len(names))))
+                continue
+            if single:
+                columns.append(S.index(names))
+            else:
+                columns.append(np.column_stack([S.index(name)
+                                                for name in names]))
+        offsets = np.zeros(len(columns) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in columns], out=offsets[1:])
+        if columns:
+            values = np.concatenate(columns)
+        else:
+            values = np.zeros((0,) if single else (0, len(names)))
+        return values, offsets
+
+    def to_npy(self, path, mca_dtype=np.float64):
+        """Convert the file to a directory of .npy files.
 
-    def get_MCA(self, key):
+        Open it again with specfile(path, backend='store'). Arrays are
+        then memory-mapped and no text is parsed.
+
+        Parameters
+        ----------
+        path : string
+            Directory to write
+        mca_dtype : numpy dtype
+            dtype of the stored MCA counts e.g. np.uint16
+        """
+        self._write_store(path, 'npy', mca_dtype)
+
+    def to_hdf5(self, path, mca_dtype=np.float64):
+        """Convert the file to an HDF5 file of chunked datasets.
+
+        Open it again with specfile(path, backend='store').
+        h5py must be installed.
+
+        Parameters
+        ----------
+        path : string
+            File to write
+        mca_dtype : numpy dtype
+            dtype of the stored MCA counts e.g. np.uint16
+        """
+        self._write_store(path, 'hdf5', mca_dtype)
+
+    def _write_store(self, path, format, mca_dtype):
+        if self.backend == 'pymca':
+            raise ValueError("Conversion needs the native backend")
+        from pymcaspec.store import write_store
+        write_store(self.source, path, format=format, mca_dtype=mca_dtype)
+
+    @timed_method('specfile.get_MCA')
+    def get_MCA(self, key, dtype=None):
         """Get MCA data
 
         Params
@@ -334,6 +984,9 @@ class specfile:
         key : string
             key for source following the rules below
             e.g. 1.1.1
+        dtype : numpy dtype or None
+            Cast the counts to this dtype e.g. np.uint16, raising
+            OverflowError if they do not fit. float64 if None.
 
         Returns
         ------
@@ -342,18 +995,64 @@ class specfile:
         """
         do = self.source._getMcaData(key)
         data = do.data
+        if dtype is not None:
+            data = to_count_dtype(data, dtype)
 
         return data
 
-    def get_all_MCA(self):
+    @timed_method('specfile.get_all_MCA')
+    def get_all_MCA(self, keys=None, channels=None, dtype=None):
         """Get all the MCA data for channel 1
 
+        With the native backend all spectra are decoded in one pass over
+        the file into a preallocated array.
+
+        Params
+        ------
+        keys : list of strings or None
+            Scan keys to read e.g. ['1.1', '2.1']. All keys if None.
+        channels : slice, tuple or None
+            Channel range to decode as a slice or (start, stop) of array
+            indices. All channels if None.
+        dtype : numpy dtype or None
+            dtype of the returned array. Compact integer types such as
+            np.uint16 or np.uint32 cut memory for detector counts and
+            raise OverflowError if a count does not fit. float64 if None.
+
         Returns
         ------
         dataset : array
-            data
+            data in shape (len(keys), channels)
         """
-        dataset = np.array([self.get_MCA(key + '.1') for key in self.keys()])
+        if keys is None:
+            keys = self.keys()
+        if dtype is None:
+            dtype = np.float64
+        if self.result_cache is not None:
+            params = (list(keys), channels, np.dtype(dtype).str)
+            if isinstance(channels, slice):
+                params = (params[0], (channels.start, channels.stop,
+                                      channels.step), params[2])
+            if self.backend == 'store':
+                files = [self.source.data_file]
+            else:
+                files = [self.filename]
+            return self.result_cache.cached(
+                'specfile.get_all_MCA',
+                lambda: self._get_all_MCA(keys, channels, dtype),
+                files=files, params=params)
+        return self._get_all_MCA(keys, channels, dtype)
+
+    def _get_all_MCA(self, keys, channels, dtype):
+        if self.backend != 'pymca':
+            return self.source.get_mca_array(keys, channels=channels,
+                                             dtype=dtype)
+        if channels is None:
+            channels = slice(None)
+        elif not isinstance(channels, slice):
+            channels = slice(*channels)
+        dataset = np.array([self.get_MCA(key + '.1', dtype=dtype)[channels]
+                            for key in keys])
         return dataset
 
     def __getitem__(self, keys):
@@ -361,58 +1060,129 @@ class specfile:
 
         Parameters
         ----------
-        keys : list of keys to index specfile
-            The name scan to index from the specfile.
-            Key usually are of the form '5.1' or similar.
-            If a number is passed it will be converted to stringself.
-            If the indexing fails the string will be appended by '.1'
-            If a single string, float or integer is passed it will be
-            converted to a list
+        keys : key, list, array or slice
+            A single key such as '5.1', '5' or 5, which mean scan 5.1.
+            A list or integer array of keys or scan numbers.
+            A boolean mask over keys().
+            A slice of scan numbers, where negative values count back
+            from the last scan number e.g. F[-10:] for the last ten.
 
         Returns
         -----
         S : instance of scan class
 
         """
-        # If keys indexes directly use that
-        try:
-            return scan([self.index(keys)])
-        except (KeyError, SyntaxError, AttributeError, IndexError, ValueError):
-            pass
-
-        # If keys is slice make an interable
-        if type(keys) == slice:
-            start = keys.start
-            stop = keys.stop
-            step = keys.step
-            # reassign negative indices if needed
-            if start < 0:
-                size = self.source.getSourceInfo()['Size']
-                start = size + 1 + start
-            if keys.stop < 0:
-                size = self.source.getSourceInfo()['Size']
-                stop = size + 1 + stop
-            if step is None:
-                keys = range(start, stop)
+        if isinstance(keys, slice):
+            keys = self._number_range(keys)
+        elif isinstance(keys, np.ndarray):
+            if keys.dtype == bool:
+                keys = self._mask_keys(keys)
             else:
-                keys = range(start, stop, step)
-                
-        return scan([self.index(key) for key in keys])
-
+                keys = keys.tolist()
+        elif isinstance(keys, (list, tuple, range)):
+            if keys and all(isinstance(key, (bool, np.bool_))
+                            for key in keys):
+                keys = self._mask_keys(keys)
+        else:
+            return self._scan([self.index(keys)])
+        return self.load_many(keys)
+
+    def _number_range(self, keys):
+        """Scan numbers of a slice, negative values counted from the end"""
+        if self.follow:
+            self.refresh()
+        if not self._scan_numbers:
+            return []
+        first, last = self._scan_numbers[0], self._scan_numbers[-1]
+        start, stop, step = keys.start, keys.stop, keys.step
+        if step is None:
+            step = 1
+        if start is not None and start < 0:
+            start = last + 1 + start
+        if stop is not None and stop < 0:
+            stop = last + 1 + stop
+        if start is None:
+            start = first if step > 0 else last
+        if stop is None:
+            stop = last + 1 if step > 0 else first - 1
+        return range(start, stop, step)
+
+    def _mask_keys(self, mask):
+        """Keys selected by a boolean mask over keys()"""
+        keys = self.keys()
+        if len(mask) != len(keys):
+            raise IndexError("boolean mask of length {} does not match {} "
+                             "scans".format(len(mask), len(keys)))
+        return [key for key, selected in zip(keys, mask) if selected]
 
     def __iter__(self):
-        all_scans = []
-        for key in self.keys():
-            try:
-                all_scans.append(self[key])
-            except TypeError:
-                pass
-
-        yield from all_scans
+        """Iterating returns scan objects parsed one at a time.
+        Empty scans are skipped. See iter_scans."""
+        return self.iter_scans()
 
+    def iter_scans(self, keys=None, prefetch=0, chunksize=None):
+        """Generate scan objects, parsing each scan only when needed.
 
-    # Append info to get_MCA docustring
+        Parameters
+        ----------
+        keys : list of strings or None
+            Scan keys. All keys if None.
+        prefetch : integer
+            Number of scans (or chunks) a background thread parses ahead
+            of the consumer. 0 parses in the calling thread.
+        chunksize : integer or None
+            If given yield scan objects combining up to chunksize scans
+
+        Yields
+        -----
+        S : instance of scan class
+            One scan, or one chunk of scans if chunksize is given.
+            Empty scans are skipped.
+        """
+        if keys is None:
+            keys = self.keys()
+
+        def dataobjects():
+            for key in keys:
+                try:
+                    yield self.index(key)
+                except TypeError:
+                    pass
+
+        def scans():
+            if chunksize is None:
+                for dataobject in dataobjects():
+                    yield self._scan([dataobject])
+                return
+            chunk = []
+            for dataobject in dataobjects():
+                chunk.append(dataobject)
+                if len(chunk) == chunksize:
+                    yield self._scan(chunk)
+                    chunk = []
+            if chunk:
+                yield self._scan(chunk)
+
+        if prefetch:
+            return prefetch_scans(scans(), prefetch)
+        return scans()
+
+
+def _is_mca_key(key):
+    """Whether key is of the form 'scan.order.mca'"""
+    return isinstance(key, str) and key.count('.') in (2, 3)
+
+
+def _add_pymca_doc():
+    """Append the PyMca selection info to the get_MCA docstring
+
+    Done when the PyMca backend is first used so that importing
+    pymcaspec does not import PyMca.
+    """
+    if getattr(_add_pymca_doc, 'done', False):
+        return
+    _add_pymca_doc.done = True
     from PyMca5.PyMcaCore.SpecFileLayer import SpecFileLayer
     alldoc = SpecFileLayer.LoadSource.__doc__
     adddoc = alldoc.split("valid for ScanType==SCAN or MESH or MCA")[1]
-    get_MCA.__doc__ += adddoc
+    specfile.get_MCA.__doc__ += adddoc
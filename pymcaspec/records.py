@@ -0,0 +1,161 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+from pymcaspec.headertable import to_float
+from pymcaspec.specsource import (SF_MCA, SF_MESH, SF_NMCA, SF_SCAN,
+                                  get_scan_type)
+
+
+class MotorTable:
+    """Baseline motor positions of all scans of a file, shared by records
+
+    values has shape (scans, motors) and columns maps each motor name to
+    its column, as in specfile.baseline_motors().
+    """
+    __slots__ = ('values', 'columns', '_name_columns')
+
+    def __init__(self, values, columns):
+        self.values = values
+        self.columns = columns
+        self._name_columns = {}
+
+    def columns_of(self, names):
+        """Columns of a list of motor names, None if a name is repeated
+
+        A repeated name has only one column in the table, that of its
+        first value. Lists are shared by the scans of a file header so
+        the result is kept per list.
+        """
+        found = self._name_columns.get(id(names))
+        if found is None or found[0] is not names:
+            if len(set(names)) < len(names):
+                columns = None
+            else:
+                columns = np.array([self.columns[name] for name in names],
+                                   dtype=np.intp)
+            found = self._name_columns[id(names)] = (names, columns)
+        return found[1]
+
+
+class ScanRecord:
+    """Compact stand-in for a DataObject of one scan
+
+    Only the key, command, labels and data are held. Motor values are a
+    row of a MotorTable shared by the file, motor names are the list
+    shared by the file header, and the header text is read from the
+    source only when it is asked for. info gives the usual dict
+    interface on demand.
+    """
+    __slots__ = ('key', 'number', 'order', 'command', 'labels', 'data',
+                 'npoints', 'nmca', 'motor_names', '_motor_table',
+                 '_motor_row', '_source', '_header')
+
+    def __init__(self, key, number, order, command, labels, data, npoints,
+                 nmca, motor_names, motor_table, motor_row, source):
+        self.key = key
+        self.number = number
+        self.order = order
+        self.command = command
+        self.labels = labels
+        self.data = data
+        self.npoints = npoints
+        self.nmca = nmca
+        self.motor_names = motor_names
+        self._motor_table = motor_table
+        self._motor_row = motor_row
+        self._source = source
+        self._header = None
+
+    @property
+    def motor_values(self):
+        """Baseline motor positions in the order of motor_names"""
+        if not self.motor_names:
+            return None
+        columns = self._motor_table.columns_of(self.motor_names)
+        if columns is None:
+            # repeated names are not all in the table; read the #P lines
+            return [to_float(value)
+                    for line in self._source.get_scan_header(self.key)
+                    if line[:2] == '#P'
+                    and line.partition(' ')[0][2:].isdigit()
+                    for value in line.split()[1:]]
+        return self._motor_table.values[self._motor_row, columns].tolist()
+
+    @property
+    def header(self):
+        """Header lines of the scan, read when first used"""
+        if self._header is None:
+            self._header = self._source.get_scan_header(self.key)
+        return self._header
+
+    @property
+    def info(self):
+        return RecordInfo(self)
+
+
+class RecordInfo(Mapping):
+    """Read-only info dict of a ScanRecord, computed per item"""
+    __slots__ = ('record',)
+
+    _ITEMS = {
+        'Key': lambda r: r.key,
+        'Number': lambda r: r.number,
+        'Order': lambda r: r.order,
+        'Command': lambda r: r.command,
+        'LabelNames': lambda r: list(r.labels),
+        'MotorNames': lambda r: r.motor_names or None,
+        'MotorValues': lambda r: r.motor_values,
+        'Lines': lambda r: r.npoints,
+        'Cols': lambda r: len(r.labels),
+        'NbMca': lambda r: r.nmca,
+        'ScanType': lambda r: get_scan_type(r.npoints, r.nmca, r.command),
+        'Header': lambda r: r.header,
+    }
+
+    def __init__(self, record):
+        self.record = record
+
+    def __getitem__(self, name):
+        return self._ITEMS[name](self.record)
+
+    def __iter__(self):
+        return iter(self._ITEMS)
+
+    def __len__(self):
+        return len(self._ITEMS)
+
+
+def load_record(source, key, motor_table):
+    """Load a scan of a SpecSource as a ScanRecord
+
+    Parameters
+    ----------
+    source : SpecSource
+        Native or stored source
+    key : string
+        Scan key 'scan.order'
+    motor_table : MotorTable
+        Motor positions of all scans of the source in file order
+
+    Returns
+    -------
+    record : ScanRecord
+        The scan with the same data as getDataObject
+    """
+    idx = source.spec_index
+    position = idx.position(key)
+    _, data, mcas = source._read_scan(position)
+    command = idx.commands[position]
+    scan_type = get_scan_type(data.shape[0], len(mcas), command)
+    if scan_type & (SF_SCAN | SF_MESH):
+        values = data
+    elif scan_type & (SF_MCA | SF_NMCA):
+        values = source._mca_values(mcas[0])
+    else:
+        raise TypeError("getData unknown type")
+    file_header = idx.headers[idx.header_ids[position]]
+    return ScanRecord(key, idx.numbers[position], idx.orders[position],
+                      command, idx.labels[position], values, data.shape[0],
+                      len(mcas), file_header['motor_names'], motor_table,
+                      position, source)
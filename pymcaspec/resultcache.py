@@ -0,0 +1,264 @@
+import functools
+import hashlib
+import inspect
+import os
+import tempfile
+
+import numpy as np
+
+from pymcaspec.indexcache import file_signature
+
+
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+def default_cache_dir():
+    """$PYMCASPEC_CACHE or ~/.cache/pymcaspec"""
+    return os.environ.get('PYMCASPEC_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache',
+                                       'pymcaspec'))
+
+
+def _hash_value(digest, value):
+    """Feed a canonical form of value into digest"""
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        digest.update('ndarray{}{}'.format(value.dtype.str,
+                                           value.shape).encode())
+        digest.update(value.tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update('{}{}'.format(type(value).__name__,
+                                    len(value)).encode())
+        for item in value:
+            _hash_value(digest, item)
+    elif isinstance(value, dict):
+        digest.update('dict{}'.format(len(value)).encode())
+        for key in sorted(value, key=repr):
+            _hash_value(digest, key)
+            _hash_value(digest, value[key])
+    elif isinstance(value, (np.dtype, type)):
+        digest.update('dtype{}'.format(np.dtype(value).str).encode())
+    else:
+        digest.update(repr(value).encode())
+    digest.update(b'\0')
+
+
+class ResultCache:
+    """Content-addressed disk cache for reduced data
+
+    Entries are keyed on the identity (size, mtime and hash of the head)
+    of the source files plus the parameters of the reduction, and stored
+    as .npz files in one directory. When the directory grows beyond
+    max_bytes the least recently used entries are removed.
+    """
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        """Open or create a cache
+
+        Parameters
+        ----------
+        directory : string or None
+            Where entries are stored. default_cache_dir() if None.
+        max_bytes : integer
+            Size cap of the directory
+        """
+        if directory is None:
+            directory = default_cache_dir()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, name, files=(), params=None):
+        """Content address of a result
+
+        Parameters
+        ----------
+        name : string
+            Name of the reduction
+        files : list of strings
+            Source files whose identity is part of the key
+        params : object
+            Parameters of the reduction. Arrays are hashed by content.
+
+        Returns
+        -------
+        key : string
+            Hex digest
+        """
+        digest = hashlib.sha256()
+        _hash_value(digest, (CACHE_VERSION, name,
+                             [file_signature(f) for f in files], params))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        """Look up a result
+
+        Returns
+        -------
+        found : bool
+            Whether the result is cached
+        result : array, tuple of arrays or None
+            The result
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                count = int(stored['count'])
+                arrays = tuple(stored['arr_{}'.format(i)]
+                               for i in range(abs(count)))
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return False, None
+        try:
+            # mark the entry as recently used for evict
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        # a negative count marks a single array
+        return True, arrays[0] if count < 0 else arrays
+
+    def put(self, key, result):
+        """Store a result, an array or a tuple of arrays
+
+        Results that cannot be written are skipped.
+        """
+        if isinstance(result, tuple):
+            arrays = [np.asarray(a) for a in result]
+            count = len(arrays)
+        else:
+            arrays = [np.asarray(result)]
+            count = -1
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as fh:
+                    np.savez(fh, *arrays, count=np.array(count))
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            return
+        self.evict()
+
+    def entries(self):
+        """Cache files as (last use, size, path), least recent first"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith('.npz'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """Remove least recently used entries beyond max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all entries"""
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        """Hit and miss counts of this session and the size on disk
+
+        Returns
+        -------
+        stats : dict
+            'hits', 'misses', 'evictions', 'entries', 'bytes' and
+            'max_bytes'
+        """
+        entries = self.entries()
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes}
+
+    def cached(self, name, compute, files=(), params=None):
+        """Return the stored result or compute and store it
+
+        Parameters
+        ----------
+        name : string
+            Name of the reduction
+        compute : function
+            Called without arguments on a miss
+        files : list of strings
+            Source files whose identity is part of the key
+        params : object
+            Parameters of the reduction
+
+        Returns
+        -------
+        result : array or tuple of arrays
+            The result
+        """
+        key = self.key(name, files, params)
+        found, result = self.get(key)
+        if not found:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def memoize(self, func, file_args=()):
+        """Wrap a reduction function so that its results are cached
+
+        Parameters
+        ----------
+        func : function
+            Returns an array or a tuple of arrays, e.g.
+            pymcaspec.utils.bin_RIXS
+        file_args : list of strings
+            Names of arguments that are paths of source files, whose
+            identity rather than name is used in the key
+
+        Returns
+        -------
+        wrapper : function
+            Same signature as func
+
+        Example
+        --------
+        cache = ResultCache()
+        bin_RIXS = cache.memoize(pymcaspec.utils.bin_RIXS)
+        """
+        signature = inspect.signature(func)
+        name = '{}.{}'.format(func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            files = [params[arg] for arg in file_args]
+            return self.cached(name, lambda: func(*args, **kwargs),
+                               files=files, params=params)
+        return wrapper
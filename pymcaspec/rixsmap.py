@@ -0,0 +1,258 @@
+"""Build RIXS maps from the <stem>.scanNNN.MYT files of many scans.
+
+Each MYT file is binned onto a common energy grid in a process pool and
+the spectra are stacked into a 2D map against a motor of the main file.
+
+Command line use::
+
+    python -m pymcaspec.rixsmap 20March2018 --scans 440-447 \\
+        --magicchannel 1050.5 --d 0.7605 --R 1000 --energy-edge 8.335 \\
+        --min-chan 1021.5 --max-chan 1080.5 --threshold 1000 \\
+        --axis-motor Theta --output map.npz
+"""
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from pymcaspec.pymcaspec import specfile
+from pymcaspec.utils import (bin_RIXS, calculate_energy_per_pixel,
+                             default_bin_edges, get_merixE)
+
+
+_MYT_PATTERN = re.compile(r'\.scan(\d+)\.MYT$')
+
+
+def find_myt_files(filestem, scan_numbers=None):
+    """Find the MYT files belonging to a main spec file
+
+    Parameters
+    ----------
+    filestem : string
+        Path of the main spec file e.g. 'data/20March2018'
+    scan_numbers : list of integers or None
+        Scans to look for. All MYT files found if None.
+
+    Returns
+    -------
+    myt_files : dict
+        Scan number to MYT file path, in order of scan number
+    """
+    found = {}
+    for path in glob.glob(glob.escape(filestem) + '.scan*.MYT'):
+        match = _MYT_PATTERN.search(path)
+        if match is not None:
+            found[int(match.group(1))] = path
+    if scan_numbers is None:
+        return dict(sorted(found.items()))
+    missing = [number for number in scan_numbers if number not in found]
+    if missing:
+        raise IOError("No MYT file for scans {} of {}".format(missing,
+                                                               filestem))
+    return {number: found[number] for number in scan_numbers}
+
+
+def reduce_myt_file(filename, magicchannel, energy_per_pixel, bin_edges,
+                    monitor='i2', min_chan=-np.inf, max_chan=np.inf,
+                    threshold=np.inf):
+    """Bin the RIXS spectrum of one MYT file
+
+    Parameters
+    ----------
+    filename : string
+        Path of the MYT file
+    magicchannel : float
+        The magic rerference channel on the mythen
+    energy_per_pixel  : float
+        Energy per Mythen channel in keV
+    bin_edges : array
+        The energy bin edges for the binning
+    monitor : string
+        Column used as the monitor of each readout
+    min_chan : integer
+        Minimum channel -- those below this are set to zero
+    max_chan : integer
+        Minimum channel -- those below this are set to zero
+    threshold : float
+        set values above this to zero
+
+    returns
+    -------
+    I : array
+        Intensities
+    M : array
+        Montior
+    N : array
+        Number of contributing mythen pixels
+    """
+    with specfile(filename, index_cache=False) as F:
+        keys = F.keys()
+        values, offsets = F.columns(monitor, keys)
+        empty = np.diff(offsets) == 0
+        if empty.any():
+            raise ValueError("Readouts {} of {} have no {} value".format(
+                [key for key, no_data in zip(keys, empty) if no_data],
+                filename, monitor))
+        central_Ms = values[offsets[:-1]]
+        central_Es = get_merixE(F)
+        mythen_dataset = F.get_all_MCA(keys)
+    _, I, M, N = bin_RIXS(central_Es, central_Ms, mythen_dataset,
+                          magicchannel, energy_per_pixel,
+                          min_chan=min_chan, max_chan=max_chan,
+                          threshold=threshold, bin_edges=bin_edges)
+    return I, M, N
+
+
+def build_rixs_map(filestem, scan_numbers, magicchannel, energy_per_pixel,
+                   bin_edges=None, axis_motor=None, monitor='i2',
+                   min_chan=-np.inf, max_chan=np.inf, threshold=np.inf,
+                   workers=None):
+    """Bin the MYT files of many scans into a RIXS map
+
+    Parameters
+    ----------
+    filestem : string
+        Path of the main spec file. The MYT files are
+        <filestem>.scan<number>.MYT
+    scan_numbers : list of integers
+        Scans forming the rows of the map
+    magicchannel : float
+        The magic rerference channel on the mythen
+    energy_per_pixel  : float
+        Energy per Mythen channel in keV
+    bin_edges : array or None
+        The energy bin edges shared by all scans.
+        If None they are built from the energies of the first scan.
+    axis_motor : string or None
+        Baseline motor of the main file, or 'h', 'k' or 'l', giving the
+        axis of the rows. The scan numbers if None.
+    monitor : string
+        Column used as the monitor of each readout
+    min_chan : integer
+        Minimum channel -- those below this are set to zero
+    max_chan : integer
+        Minimum channel -- those below this are set to zero
+    threshold : float
+        set values above this to zero
+    workers : integer or None
+        Number of processes. None uses one per CPU, 1 runs in this
+        process.
+
+    returns
+    -------
+    rixs_map : dict
+        'E' bin centers, 'axis' row values, 'scan_numbers', and 'I',
+        'M' and 'N' maps in shape (scans, bins)
+    """
+    scan_numbers = list(scan_numbers)
+    if not scan_numbers:
+        raise ValueError("No scans given for the RIXS map of {}".format(
+            filestem))
+    myt_files = find_myt_files(filestem, scan_numbers)
+    if bin_edges is None:
+        with specfile(myt_files[scan_numbers[0]], index_cache=False) as F:
+            bin_edges = default_bin_edges(get_merixE(F))
+    bin_edges = np.asarray(bin_edges, dtype=np.float64)
+
+    if axis_motor is None:
+        axis = np.array(scan_numbers, dtype=np.float64)
+    else:
+        with specfile(filestem) as F:
+            table = F.header_table(
+                ['{}.1'.format(number) for number in scan_numbers])
+        if axis_motor in ('h', 'k', 'l'):
+            axis = table['hkl'][:, 'hkl'.index(axis_motor)]
+        elif axis_motor in table['motor_columns']:
+            axis = table['motors'][:, table['motor_columns'][axis_motor]]
+        else:
+            raise KeyError("{} is not a baseline motor of {}".format(
+                axis_motor, filestem))
+
+    reduce = partial(reduce_myt_file, magicchannel=magicchannel,
+                     energy_per_pixel=energy_per_pixel, bin_edges=bin_edges,
+                     monitor=monitor, min_chan=min_chan, max_chan=max_chan,
+                     threshold=threshold)
+    paths = [myt_files[number] for number in scan_numbers]
+    if workers == 1 or len(paths) < 2:
+        results = [reduce(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(reduce, paths))
+
+    I, M, N = (np.array(rows) for rows in zip(*results))
+    return {'E': (bin_edges[:-1] + bin_edges[1:])/2,
+            'axis': axis,
+            'scan_numbers': np.array(scan_numbers),
+            'I': I, 'M': M, 'N': N}
+
+
+def parse_scan_numbers(text):
+    """Read scan numbers such as '440-447,450' into a list"""
+    scan_numbers = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        if last:
+            scan_numbers.extend(range(int(first), int(last) + 1))
+        else:
+            scan_numbers.append(int(first))
+    return scan_numbers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Bin the MYT files of many scans into a RIXS map')
+    parser.add_argument('filestem', help='path of the main spec file')
+    parser.add_argument('--scans', type=parse_scan_numbers,
+                        help="scan numbers e.g. '440-447,450'. "
+                             "All MYT files if omitted.")
+    parser.add_argument('--magicchannel', type=float, required=True)
+    parser.add_argument('--energy-per-pixel', type=float,
+                        help='keV per channel, or give --d, --R and '
+                             '--energy-edge')
+    parser.add_argument('--d', type=float, help='analyzer d spacing in A')
+    parser.add_argument('--R', type=float, help='analyzer radius in mm')
+    parser.add_argument('--energy-edge', type=float, help='edge in keV')
+    parser.add_argument('--bins', type=float, nargs=3,
+                        metavar=('START', 'STOP', 'NUM'),
+                        help='bin edges as np.linspace(START, STOP, NUM)')
+    parser.add_argument('--min-chan', type=float, default=-np.inf)
+    parser.add_argument('--max-chan', type=float, default=np.inf)
+    parser.add_argument('--threshold', type=float, default=np.inf)
+    parser.add_argument('--monitor', default='i2')
+    parser.add_argument('--axis-motor')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default='rixs_map.npz')
+    args = parser.parse_args(argv)
+
+    if args.energy_per_pixel is not None:
+        energy_per_pixel = args.energy_per_pixel
+    elif None not in (args.d, args.R, args.energy_edge):
+        energy_per_pixel = calculate_energy_per_pixel(args.d, args.R,
+                                                      args.energy_edge)
+    else:
+        parser.error('give --energy-per-pixel or --d, --R and --energy-edge')
+    scan_numbers = args.scans
+    if scan_numbers is None:
+        scan_numbers = list(find_myt_files(args.filestem))
+        if not scan_numbers:
+            parser.error('no MYT files found for {}'.format(args.filestem))
+    bin_edges = None
+    if args.bins is not None:
+        start, stop, num = args.bins
+        bin_edges = np.linspace(start, stop, int(num))
+
+    rixs_map = build_rixs_map(args.filestem, scan_numbers, args.magicchannel,
+                              energy_per_pixel, bin_edges=bin_edges,
+                              axis_motor=args.axis_motor,
+                              monitor=args.monitor, min_chan=args.min_chan,
+                              max_chan=args.max_chan,
+                              threshold=args.threshold, workers=args.workers)
+    np.savez(os.path.abspath(args.output), **rixs_map)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+import mmap
+import os
+
+
+# First characters of a data line after any indentation
+NUMBER_START = b'0123456789+-.'
+
+
+def split_labels(line):
+    """Split a #L or #O line into names.
+
+    Names in spec headers are separated by two or more spaces so that
+    names such as 'Two Theta' survive.
+
+    Parameters
+    ----------
+    line : string
+        The header line without the leading tag e.g. 'H  K  L  Epoch'
+
+    Returns
+    -------
+    names : list of strings
+        The names in the line
+    """
+    return [name.strip() for name in line.split('  ') if name.strip()]
+
+
+class SpecIndex:
+    """Byte-offset index of the scans in a spec file.
+
+    One pass over the file records where each #S block starts and ends,
+    its #L labels and its number of data points and MCA spectra. Scan
+    data are then read lazily from these offsets.
+    """
+    def __init__(self, filename, build=True):
+        """Index a spec file
+
+        Parameters
+        ----------
+        filename : string
+            Path to the spec file
+        build : bool
+            If False create an empty index to be filled from a cache
+        """
+        self.filename = filename
+        self.numbers = []
+        self.orders = []
+        self.offsets = []
+        self.lengths = []
+        self.npoints = []
+        self.nmca = []
+        self.commands = []
+        self.labels = []
+        self.header_ids = []
+        self.headers = []
+        self.key_positions = {}
+        self._number_counts = {}
+        self._tail = None
+        self.size = 0
+        self.mtime_ns = 0
+        self._map = None
+        # header table of all scans when loaded from the index cache
+        self.header_table = None
+        if build:
+            self._index_from(0)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def keys(self):
+        """Keys of all scans of the form 'number.order'
+
+        Returns
+        -------
+        keys : list
+            List of all keys in the file order
+        """
+        return ['{}.{}'.format(number, order)
+                for number, order in zip(self.numbers, self.orders)]
+
+    def position(self, key):
+        """Position of a scan key in the file
+
+        Parameters
+        ----------
+        key : string
+            Key of the form 'number.order' e.g. '5.1'
+
+        Returns
+        -------
+        position : integer
+            Index of the scan in file order
+        """
+        try:
+            return self.key_positions[key]
+        except (KeyError, TypeError):
+            raise KeyError("Key {} not in source keys".format(key))
+
+    def rebuild_lookup(self):
+        """Recreate the key lookup after the columns are filled directly"""
+        self.key_positions = {}
+        self._number_counts = {}
+        for position, (number, order) in enumerate(zip(self.numbers,
+                                                       self.orders)):
+            self.key_positions['{}.{}'.format(number, order)] = position
+            self._number_counts[number] = max(
+                order, self._number_counts.get(number, 0))
+
+    def read_block(self, position):
+        """Read the raw bytes of one scan block
+
+        Parameters
+        ----------
+        position : integer
+            Index of the scan in file order
+
+        Returns
+        -------
+        block : bytes
+            The text of the scan from its #S line to the next scan
+        """
+        with open(self.filename, 'rb') as fh:
+            fh.seek(self.offsets[position])
+            return fh.read(self.lengths[position])
+
+    def buffer(self):
+        """Read-only memory map of the file
+
+        The map is renewed when the index has grown beyond it.
+
+        Returns
+        -------
+        buffer : mmap or None
+            None if the file is empty or now shorter than the index,
+            in which case blocks are read with read_block.
+        """
+        try:
+            file_size = os.path.getsize(self.filename)
+        except OSError:
+            return None
+        if file_size < self.size or self.size == 0:
+            return None
+        if self._map is None or len(self._map) < self.size:
+            self.close()
+            with open(self.filename, 'rb') as fh:
+                self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def close(self):
+        """Close the memory map of the file
+
+        The file is mapped again by buffer when it is next needed.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def read_range(self, positions):
+        """Read the raw bytes spanning several scan blocks in one read
+
+        Parameters
+        ----------
+        positions : list of integers
+            Indices of the scans in file order
+
+        Returns
+        -------
+        start : integer
+            Byte offset of the returned text in the file
+        text : bytes
+            The text from the first to the end of the last scan
+        """
+        start = min(self.offsets[p] for p in positions)
+        stop = max(self.offsets[p] + self.lengths[p] for p in positions)
+        with open(self.filename, 'rb') as fh:
+            fh.seek(start)
+            return start, fh.read(stop - start)
+
+    def read_blocks(self, positions):
+        """Read the raw bytes of several scan blocks
+
+        Blocks close together in the file are read with one read.
+
+        Parameters
+        ----------
+        positions : list of integers
+            Indices of the scans in file order
+
+        Returns
+        -------
+        blocks : list of bytes
+            The text of each scan
+        """
+        if not positions:
+            return []
+        lengths = [self.lengths[p] for p in positions]
+        span = (max(self.offsets[p] + self.lengths[p] for p in positions)
+                - min(self.offsets[p] for p in positions))
+        if span > 2 * sum(lengths):
+            # scattered scans
+            with open(self.filename, 'rb') as fh:
+                blocks = []
+                for position in positions:
+                    fh.seek(self.offsets[position])
+                    blocks.append(fh.read(self.lengths[position]))
+            return blocks
+        start, text = self.read_range(positions)
+        return [text[self.offsets[p] - start:self.offsets[p] - start + length]
+                for p, length in zip(positions, lengths)]
+
+    def _add_header(self, offset):
+        self.headers.append({'offset': offset, 'lines': [],
+                             'motor_names': []})
+
+    def _close_scan(self, scan, end):
+        position = len(self.numbers)
+        order = self._number_counts.get(scan['number'], 0) + 1
+        self._number_counts[scan['number']] = order
+        self.numbers.append(scan['number'])
+        self.orders.append(order)
+        self.offsets.append(scan['offset'])
+        self.lengths.append(end - scan['offset'])
+        self.npoints.append(scan['npoints'])
+        self.nmca.append(scan['nmca'])
+        self.commands.append(scan['command'])
+        self.labels.append(scan['labels'])
+        self.header_ids.append(len(self.headers) - 1)
+        self.key_positions['{}.{}'.format(scan['number'], order)] = position
+
+    def _drop_last(self):
+        """Remove the last scan so that it can be indexed again"""
+        number = self.numbers.pop()
+        order = self.orders.pop()
+        for column in (self.offsets, self.lengths, self.npoints, self.nmca,
+                       self.commands, self.labels, self.header_ids):
+            column.pop()
+        del self.key_positions['{}.{}'.format(number, order)]
+        self._number_counts[number] = order - 1
+
+    def update(self):
+        """Index bytes appended to the file since the last index
+
+        Parsing resumes after the last complete line, so the scan that
+        was being written is extended in place and new scans are added.
+        A file that shrank or was rewritten is indexed from scratch.
+
+        Returns
+        -------
+        first_changed : integer
+            Position of the first scan that is new or has grown
+        """
+        stat = os.stat(self.filename)
+        if stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns:
+            return len(self)
+        self.header_table = None
+        if stat.st_size <= self.size or not self.numbers:
+            self.close()
+            self.__init__(self.filename)
+            return 0
+        tail = self._tail
+        if tail is None:
+            # index loaded from a cache, which holds no parser state
+            if self.headers[-1]['offset'] > self.offsets[-1]:
+                tail = {'offset': self.headers.pop()['offset']}
+            else:
+                tail = {'offset': self.offsets[-1]}
+                self._drop_last()
+            tail.update(scan=None, in_header=False, in_mca=False)
+        elif tail['scan'] is not None:
+            self._drop_last()
+        first_changed = len(self)
+        self._index_from(tail['offset'], tail)
+        return first_changed
+
+    def _index_from(self, start, tail=None):
+        """Index the file from byte offset start to the end
+
+        tail is the parser state at start when resuming an index.
+        """
+        if tail is None:
+            tail = {'scan': None, 'in_header': False, 'in_mca': False}
+        scan = tail['scan']
+        in_header = tail['in_header']
+        in_mca = tail['in_mca']
+        if scan is not None:
+            scan = dict(scan)
+        offset = start
+        partial = b''
+        with open(self.filename, 'rb') as fh:
+            self.mtime_ns = os.fstat(fh.fileno()).st_mtime_ns
+            fh.seek(start)
+            for line in fh:
+                if not line.endswith(b'\n'):
+                    # line still being written
+                    partial = line
+                    break
+                line_offset = offset
+                offset += len(line)
+                if in_mca:
+                    in_mca = line.rstrip().endswith(b'\\')
+                    continue
+                if line.startswith(b'#S '):
+                    if scan is not None:
+                        self._close_scan(scan, line_offset)
+                    if not self.headers:
+                        self._add_header(start)
+                    in_header = False
+                    fields = line[3:].decode('utf-8', 'replace').split(None, 1)
+                    scan = {'offset': line_offset, 'number': int(fields[0]),
+                            'command': fields[1].strip() if len(fields) > 1
+                            else '',
+                            'npoints': 0, 'nmca': 0, 'labels': [],
+                            'data_started': False}
+                elif line.startswith(b'#F ') or (
+                        line.startswith(b'#E ') and not in_header):
+                    if scan is not None:
+                        self._close_scan(scan, line_offset)
+                        scan = None
+                    if not in_header:
+                        self._add_header(line_offset)
+                        in_header = True
+                    self.headers[-1]['lines'].append(
+                        line.decode('utf-8', 'replace').rstrip())
+                elif in_header or (scan is None and line.startswith(b'#')):
+                    if not self.headers:
+                        self._add_header(start)
+                    in_header = True
+                    text = line.decode('utf-8', 'replace').rstrip()
+                    if text:
+                        self.headers[-1]['lines'].append(text)
+                    if line.startswith(b'#O'):
+                        self.headers[-1]['motor_names'].extend(
+                            split_labels(text.split(None, 1)[1]
+                                         if ' ' in text else ''))
+                elif scan is None:
+                    continue
+                elif line.startswith(b'#L '):
+                    scan['labels'] = split_labels(
+                        line[3:].decode('utf-8', 'replace'))
+                    scan['data_started'] = True
+                elif line.startswith(b'@A'):
+                    scan['nmca'] += 1
+                    in_mca = line.rstrip().endswith(b'\\')
+                elif (scan['data_started']
+                      and line.lstrip(b' \t')[:1] in NUMBER_START):
+                    scan['npoints'] += 1
+        self._tail = {'offset': offset, 'scan': scan,
+                      'in_header': in_header, 'in_mca': in_mca}
+        self.size = offset + len(partial)
+        if scan is not None:
+            # the final scan runs to the end of the file including any
+            # unterminated last line, which is not a data point until it
+            # is complete, as in PyMca
+            last = dict(scan)
+            if not in_mca and partial.startswith(b'@A'):
+                last['nmca'] += 1
+            self._close_scan(last, self.size)
@@ -0,0 +1,757 @@
+import os
+import re
+import warnings
+from itertools import chain, islice
+
+import numpy as np
+
+from pymcaspec.headertable import (collect_header_lines,
+                                   header_table_from_lines, table_rows)
+from pymcaspec.indexcache import get_index
+from pymcaspec.instrument import stage, timed
+from pymcaspec.specindex import NUMBER_START, SpecIndex, split_labels
+
+
+SOURCE_TYPE = 'SpecFile'
+
+SF_EMPTY = 0
+SF_SCAN = 1
+SF_MESH = 2
+SF_MCA = 4
+SF_NMCA = 8
+SF_UMCA = 16
+
+# An @A spectrum runs until the first line not ending in a backslash
+_MCA_PATTERN = re.compile(rb'^@A((?:[^\n]*\\\n)*[^\n]*)', re.M)
+# An @A spectrum with the lines continued by a trailing backslash
+_MCA_LINES = re.compile(rb'@A((?:[^\n]*\\[ \t\r]*\n)*[^\n]*)')
+# A header line of a scan
+_HEADER_LINE = re.compile(rb'^#[^\n]*', re.M)
+# Consecutive lines starting like a number after any indentation, up to
+# the end of the last one
+_DATA_RUN = re.compile(
+    rb'[ \t]*[0-9+\-.][^\n]*(?:\n[ \t]*[0-9+\-.][^\n]*)*')
+_INDENT = re.compile(rb'[ \t]*')
+# Number of values converted at a time when reading integer counts
+_COUNT_BLOCK = 1 << 20
+# Bytes of data lines located at a time when reading a few columns
+_COLUMN_PIECE = 1 << 20
+_CHANN_PATTERN = re.compile(rb'^#@CHANN\s+(\d+)', re.M)
+
+
+class DataObject:
+    """Container mirroring PyMca5.PyMcaCore.DataObject.DataObject"""
+    def __init__(self):
+        self.info = {}
+        self.data = None
+
+
+def get_scan_type(npoints, nmca, command):
+    """Classify a scan in the same way as PyMca
+
+    Parameters
+    ----------
+    npoints : integer
+        Number of data lines in the scan
+    nmca : integer
+        Number of MCA spectra in the scan
+    command : string
+        The #S scan command
+
+    Returns
+    -------
+    scan_type : integer
+        Sum of the SF_* flags describing the scan
+    """
+    if npoints > 0:
+        scan_type = SF_MESH if 'mesh' in (command or '') else SF_SCAN
+        if nmca % npoints:
+            scan_type += SF_UMCA
+        elif nmca == npoints:
+            scan_type += SF_MCA
+        elif nmca > 0:
+            scan_type += SF_NMCA
+    elif nmca == 1:
+        scan_type = SF_MCA
+    elif nmca > 1:
+        scan_type = SF_NMCA
+    else:
+        scan_type = SF_EMPTY
+    return scan_type
+
+
+def to_count_dtype(values, dtype):
+    """Cast MCA counts to a compact dtype, checking that they fit
+
+    Parameters
+    ----------
+    values : array
+        The counts
+    dtype : numpy dtype
+        Target dtype e.g. np.uint16. Integer targets require integer
+        values within the range of the dtype.
+
+    Returns
+    -------
+    values : array
+        The counts as dtype
+    """
+    dtype = np.dtype(dtype)
+    values = np.asarray(values)
+    if dtype.kind in 'ui' and values.size:
+        if values.dtype.kind == 'f' and np.any(values != np.floor(values)):
+            raise ValueError("MCA values are not integers, "
+                             "cannot store as {}".format(dtype))
+        info = np.iinfo(dtype)
+        if values.min() < info.min or values.max() > info.max:
+            raise OverflowError("MCA values {}..{} do not fit in {}".format(
+                values.min(), values.max(), dtype))
+    return values.astype(dtype, copy=False)
+
+
+def parse_floats(text):
+    """Convert whitespace separated numbers to a float array"""
+    return np.array(text.split(), dtype=np.float64)
+
+
+def parse_scan_block(block, start=0, stop=None, data_only=False,
+                     columns=None):
+    """Split the text of a scan into header lines, data and MCA spectra
+
+    Runs of data lines are located with a regular expression and each
+    run is converted with one call to np.fromstring, so no Python
+    object is created per data line or value. A run with incomplete
+    lines falls back to checking each line.
+
+    Parameters
+    ----------
+    block : bytes or mmap
+        Raw text containing the scan
+    start : integer
+        Offset of the #S line in block
+    stop : integer or None
+        Offset of the end of the scan. The end of block if None.
+    data_only : bool
+        Only read the data, returning no header lines or spectra
+    columns : list of integers or None
+        Only convert these columns of the data. All columns if None.
+
+    Returns
+    -------
+    header : list of strings
+        All lines starting with #
+    data : array
+        Data in shape (points, columns)
+    mcas : list of bytes
+        The text of each @A spectrum with continuations joined
+    """
+    if stop is None:
+        stop = len(block)
+    # an unterminated last line of the file is still being written
+    data_stop = block.rfind(b'\n', start, stop) + 1 or start
+    if block[stop - 1:stop] == b'\n':
+        data_stop = stop
+    header = []
+    runs = []
+    mcas = []
+    ncols = None
+    pos = start
+    while pos < stop:
+        end = block.find(b'\n', pos, stop)
+        if end < 0:
+            end = stop
+        first = block[pos:pos + 1]
+        if first in (b' ', b'\t'):
+            indent = _INDENT.match(block, pos, end).end()
+            if block[indent:indent + 1] in NUMBER_START and indent < end:
+                first = block[indent:indent + 1]
+        if first == b'#':
+            if not data_only or block[pos:pos + 3] == b'#L ':
+                text = block[pos:end].decode('utf-8', 'replace').rstrip('\r\n')
+                if not data_only:
+                    header.append(text)
+                if text.startswith('#L '):
+                    ncols = len(split_labels(text[3:]))
+        elif block[pos:pos + 2] == b'@A':
+            match = _MCA_LINES.match(block, pos, stop)
+            end = match.end()
+            if not data_only:
+                mcas.append(match.group(1).replace(b'\\', b' '))
+        elif ncols and first and first in NUMBER_START and end < data_stop:
+            end = _DATA_RUN.match(block, pos, data_stop).end()
+            if columns is None:
+                runs.append(_parse_data_run(block[pos:end], ncols))
+            else:
+                runs.append(_parse_data_columns(block[pos:end], ncols,
+                                                columns))
+        pos = end + 1
+    width = ncols or 0
+    if columns is not None:
+        width = len(columns)
+    if ncols and runs:
+        data = np.concatenate(runs).reshape(-1, width)
+    else:
+        data = np.zeros((0, width))
+    return header, data, mcas
+
+
+def _parse_data_columns(run, ncols, columns):
+    """Values of a few columns of consecutive data lines
+
+    The run is read in pieces of whole lines. The tokens of a piece
+    are located on a byte view of it and only those in columns are
+    copied, one column at a time, into fixed width strings that numpy
+    converts to floats. Pieces with incomplete lines or bad values fall
+    back to _parse_data_run.
+    """
+    pieces = []
+    pos = 0
+    while pos < len(run):
+        end = run.find(b'\n', pos + _COLUMN_PIECE) + 1 or len(run)
+        piece = run[pos:end]
+        values = _parse_piece_columns(piece, ncols, columns)
+        if values is None:
+            values = _parse_data_run(piece, ncols).reshape(-1, ncols)
+            values = values[:, columns]
+        pieces.append(values.ravel())
+        pos = end
+    return np.concatenate(pieces)
+
+
+def _parse_piece_columns(piece, ncols, columns):
+    """columns of whole data lines, or None if they are not all valid"""
+    nrows = piece.count(b'\n') + (not piece.endswith(b'\n'))
+    chars = np.frombuffer(piece, dtype=np.uint8)
+    # spaces, tabs and line ends separate the tokens
+    is_token = np.zeros(len(chars) + 2, dtype=bool)
+    is_token[1:-1] = chars > 32
+    edges = np.flatnonzero(is_token[1:] != is_token[:-1])
+    starts, ends = edges[0::2], edges[1::2]
+    if len(starts) != nrows * ncols:
+        return None
+    values = np.empty((nrows, len(columns)))
+    for i, column in enumerate(columns):
+        first = starts[column::ncols]
+        last = ends[column::ncols]
+        width = int((last - first).max())
+        positions = first[:, np.newaxis] + np.arange(width)
+        text = np.where(positions < last[:, np.newaxis],
+                        chars[np.minimum(positions, len(chars) - 1)],
+                        0).astype(np.uint8)
+        try:
+            values[:, i] = text.view('S{}'.format(width))[:, 0].astype(
+                np.float64)
+        except ValueError:
+            return None
+    return values
+
+
+def _parse_data_run(run, ncols):
+    """Values of consecutive data lines, keeping lines with ncols values"""
+    nrows = run.count(b'\n') + (not run.endswith(b'\n'))
+    with warnings.catch_warnings():
+        # np.fromstring warns before stopping at a bad token
+        warnings.simplefilter('ignore', DeprecationWarning)
+        try:
+            values = np.fromstring(run, dtype=np.float64, sep=' ')
+        except ValueError:
+            values = None
+    if values is None or values.size != nrows * ncols:
+        rows = [line for line in run.split(b'\n')
+                if len(line.split()) == ncols]
+        values = parse_floats(b' '.join(rows))
+    return values
+
+
+def column_indices(labels, names, key):
+    """Columns of names, which are labels or column numbers, in a scan"""
+    indices = []
+    for name in names:
+        if isinstance(name, (int, np.integer)):
+            if not -len(labels) <= name < len(labels):
+                raise IndexError("key {} not found in scan {}".format(
+                    name, key))
+            indices.append(name % len(labels))
+        elif name in labels:
+            indices.append(labels.index(name))
+        else:
+            raise IndexError("key {} not found in scan {}".format(name, key))
+    return indices
+
+
+class SpecSource:
+    """Native spec file source with the interface of PyMca's
+    SpecFileDataSource.
+
+    The file is indexed once on creation and scans are parsed only
+    when their data are requested.
+    """
+    def __init__(self, filename, index_cache=True, cache_dir=None):
+        """Initialize class
+
+        Parameters
+        ----------
+        filename : string
+            Path to the spec file
+        index_cache : bool
+            Store the index on disk and reuse it while the file is
+            unchanged
+        cache_dir : string or None
+            Directory for the index cache. If None the cache is a hidden
+            file next to the spec file.
+        """
+        self.sourceName = filename
+        self.sourceType = SOURCE_TYPE
+        self.index_cache = index_cache
+        self.cache_dir = cache_dir
+        if index_cache:
+            self.spec_index = get_index(filename, cache_dir)
+        else:
+            self.spec_index = SpecIndex(filename)
+
+    def refresh(self):
+        """Index data appended to the file since it was last indexed
+
+        Returns
+        -------
+        changed_keys : list
+            Keys of scans that are new or have grown
+        """
+        first_changed = self.spec_index.update()
+        return self.spec_index.keys()[first_changed:]
+
+    def close(self):
+        """Close the memory map of the file, see SpecIndex.close"""
+        self.spec_index.close()
+
+    def get_file_header(self, header_id=0):
+        """Lines of a file header block
+
+        Parameters
+        ----------
+        header_id : integer
+            Which header in the file
+
+        Returns
+        -------
+        header : list of strings
+            The header lines
+        """
+        if not self.spec_index.headers:
+            return []
+        return self.spec_index.headers[header_id]['lines']
+
+    def getSourceInfo(self):
+        """Information about the file without loading any scan
+
+        Returns
+        -------
+        source_info : dict
+            Has "KeyList", "Size", "NumPts", "NumMca", "Commands" and
+            "ScanType" as in PyMca
+        """
+        idx = self.spec_index
+        source_info = {'Size': len(idx),
+                       'KeyList': idx.keys(),
+                       'SourceType': SOURCE_TYPE,
+                       'SourceName': self.sourceName,
+                       'FileHeader': self.get_file_header(),
+                       'NumMca': list(idx.nmca),
+                       'NumPts': list(idx.npoints),
+                       'Commands': list(idx.commands),
+                       'ScanType': [get_scan_type(*args) for args in
+                                    zip(idx.npoints, idx.nmca, idx.commands)]}
+        return source_info
+
+    @timed('source.header_table')
+    def header_table(self, keys=None):
+        """Collect common header fields of many scans in one pass
+
+        Only the #PN, #PV, #X, #Q, #T, #D and #P<n> lines are located,
+        with one regular expression search over the scans' text, so no
+        scan data are parsed. With an index loaded from the cache the
+        table is read from the cache.
+
+        Parameters
+        ----------
+        keys : list of strings or None
+            Scan keys. All scans if None.
+
+        Returns
+        -------
+        table : dict
+            See header_table_from_lines
+        """
+        idx = self.spec_index
+        if keys is None:
+            keys = idx.keys()
+        positions = [idx.position(key) for key in keys]
+        if idx.header_table is not None:
+            return table_rows(idx.header_table, positions, keys)
+        motor_names = [idx.headers[idx.header_ids[position]]['motor_names']
+                       for position in positions]
+        return header_table_from_lines(
+            keys, collect_header_lines(idx, positions), motor_names)
+
+    def _get_file_info(self):
+        file_info = {'Title': None, 'User': None, 'Date': None,
+                     'Epoch': None, 'ScanNo': len(self.spec_index)}
+        for line in self.get_file_header():
+            if line.startswith('#E '):
+                file_info['Epoch'] = int(line[3:])
+            elif line.startswith('#D ') and file_info['Date'] is None:
+                file_info['Date'] = line[3:].strip()
+            elif line.startswith('#C ') and file_info['Title'] is None:
+                title = line[3:].split('User')
+                file_info['Title'] = title[0].strip()
+                if len(title) > 1:
+                    file_info['User'] = title[1].strip(' =:') or None
+        return file_info
+
+    def _read_scan(self, position):
+        """Header lines, data and MCA spectra of the scan at position"""
+        idx = self.spec_index
+        with stage('source.parse', idx.lengths[position]):
+            buffer = idx.buffer()
+            if buffer is None:
+                return parse_scan_block(idx.read_block(position))
+            start = idx.offsets[position]
+            return parse_scan_block(buffer, start,
+                                    start + idx.lengths[position])
+
+    @staticmethod
+    def _mca_values(mca):
+        """Counts of an MCA spectrum as returned by _read_scan"""
+        return parse_floats(mca)
+
+    def _get_scan(self, key, parsed=None, file_info=None):
+        """Parse a scan into its info dict, data and MCA text
+
+        parsed and file_info can be passed when they are already known.
+        """
+        position = self.spec_index.position(key)
+        idx = self.spec_index
+        if parsed is None:
+            parsed = self._read_scan(position)
+        header, data, mcas = parsed
+        file_header = idx.headers[idx.header_ids[position]]
+
+        info = {'SourceType': SOURCE_TYPE,
+                'SourceName': self.sourceName,
+                'Key': key,
+                'FileName': self.sourceName,
+                'FileHeader': file_header['lines'],
+                'Number': idx.numbers[position],
+                'Order': idx.orders[position],
+                'Cols': data.shape[1],
+                'Lines': data.shape[0],
+                'Date': None,
+                'MotorNames': file_header['motor_names'] or None,
+                'MotorValues': None,
+                'LabelNames': list(idx.labels[position]),
+                'Command': idx.commands[position],
+                'Header': header,
+                'NbMca': len(mcas),
+                'hkl': None}
+        motor_values = []
+        for line in header:
+            if line.startswith('#D ') and info['Date'] is None:
+                info['Date'] = line[3:].strip()
+            elif line.startswith('#Q'):
+                try:
+                    info['hkl'] = tuple(float(v) for v in line[2:].split())
+                except ValueError:
+                    pass
+            elif line.startswith('#P') and line[2:3].isdigit():
+                motor_values.extend(float(v) for v in line.split()[1:])
+        if motor_values:
+            info['MotorValues'] = motor_values
+        if info['NbMca']:
+            if info['Lines'] > 0 and info['NbMca'] % info['Lines'] == 0:
+                info['NbMcaDet'] = info['NbMca'] // info['Lines']
+            else:
+                info['NbMcaDet'] = info['NbMca']
+        info['ScanType'] = get_scan_type(info['Lines'], info['NbMca'],
+                                         info['Command'])
+        if file_info is None:
+            file_info = self._get_file_info()
+        info['FileInfo'] = dict(file_info)
+        return info, data, mcas
+
+    def get_scan_header(self, key):
+        """Header lines of a scan without parsing its data
+
+        Parameters
+        ----------
+        key : string
+            Scan key 'scan.order'
+
+        Returns
+        -------
+        header : list of strings
+            All lines of the scan starting with #
+        """
+        idx = self.spec_index
+        position = idx.position(key)
+        buffer = idx.buffer()
+        if buffer is None:
+            buffer, start = idx.read_block(position), 0
+        else:
+            start = idx.offsets[position]
+        return [match.group().decode('utf-8', 'replace').rstrip('\r\n')
+                for match in _HEADER_LINE.finditer(
+                    buffer, start, start + idx.lengths[position])]
+
+    def getDataObject(self, key, selection=None):
+        """Load a scan or an MCA spectrum
+
+        Parameters
+        ----------
+        key : string
+            'scan.order' for the scan data or 'scan.order.mca' for
+            an MCA spectrum
+        selection : None
+            Only whole scans are supported
+
+        Returns
+        -------
+        dataobject : DataObject
+            Object with info dict and data array
+        """
+        if isinstance(key, str) and key.count('.') in (2, 3):
+            return self._getMcaData(key)
+        return self._make_data_object(*self._get_scan(key),
+                                      selection=selection)
+
+    def _make_data_object(self, info, data, mcas, selection=None):
+        scan_type = info['ScanType']
+        if scan_type & (SF_SCAN | SF_MESH):
+            scan_data = data
+        elif scan_type & (SF_MCA | SF_NMCA):
+            scan_data = self._mca_values(mcas[0])
+        else:
+            raise TypeError("getData unknown type")
+        dataobject = DataObject()
+        info['selection'] = selection
+        info['selectiontype'] = '2D'
+        dataobject.info = info
+        dataobject.data = scan_data
+        return dataobject
+
+    def get_data_objects(self, keys, workers=1):
+        """Load many scans, parsing them in parallel
+
+        The scan blocks are read with as few reads as possible and the
+        file info is worked out once for all of them.
+
+        Parameters
+        ----------
+        keys : list of strings
+            Scan keys 'scan.order'
+        workers : integer or None
+            Number of processes parsing the scans. 1 parses in this
+            process. None uses one process per CPU.
+
+        Returns
+        -------
+        dataobjects : list of DataObject
+            One per key in the order of keys
+        """
+        idx = self.spec_index
+        positions = [idx.position(key) for key in keys]
+        if workers == 1 or len(positions) < 2:
+            parsed = [self._read_scan(position) for position in positions]
+        else:
+            blocks = idx.read_blocks(positions)
+            if workers is None:
+                workers = os.cpu_count() or 1
+            chunksize = max(1, len(blocks) // (4 * workers))
+            from concurrent.futures import ProcessPoolExecutor
+            with stage('source.parse_parallel',
+                       sum(len(block) for block in blocks)), \
+                    ProcessPoolExecutor(workers) as executor:
+                parsed = list(executor.map(parse_scan_block, blocks,
+                                           chunksize=chunksize))
+        file_info = self._get_file_info()
+        return [self._make_data_object(*self._get_scan(key, scan_parsed,
+                                                       file_info))
+                for key, scan_parsed in zip(keys, parsed)]
+
+    def _getMcaData(self, key):
+        """Load one MCA spectrum with key 's.o.n' or 's.o.p.n'"""
+        key_split = key.split('.')
+        scan_key = '.'.join(key_split[:2])
+        info, data, mcas = self._get_scan(scan_key)
+        try:
+            if len(key_split) == 3:
+                mca_no = int(key_split[2])
+            else:
+                mca_no = ((int(key_split[2]) - 1) * info['NbMcaDet']
+                          + int(key_split[3]))
+            if mca_no < 1:
+                raise IndexError
+            mca_text = mcas[mca_no - 1]
+        except (IndexError, ValueError, KeyError):
+            raise IOError("Single MCA read failed")
+
+        info['Key'] = key
+        info['McaCalib'] = [0.0, 1.0, 0.0]
+        info['Channel0'] = 0.0
+        for line in info['Header']:
+            if line.startswith('#@CALIB'):
+                info['McaCalib'] = [float(v) for v in line.split()[1:4]]
+            elif line.startswith('#@CHANN'):
+                info['Channel0'] = float(line.split()[2])
+        dataobject = DataObject()
+        dataobject.info = info
+        dataobject.data = self._mca_values(mca_text)
+        return dataobject
+
+    @timed('source.get_mca_array')
+    def get_mca_array(self, keys=None, mca_no=1, channels=None,
+                      dtype=np.float64):
+        """Read one MCA spectrum from each of many scans in one pass
+
+        The text spanning the scans is read once, the @A spectra are
+        located with a single regular expression search and only the
+        requested channels are converted, straight into an array
+        preallocated from the #@CHANN header.
+
+        Parameters
+        ----------
+        keys : list of strings or None
+            Scan keys e.g. ['1.1', '2.1']. All scans if None.
+        mca_no : integer
+            Which spectrum of each scan to read, starting from 1
+        channels : slice, tuple or None
+            Channel range to decode as a slice or (start, stop) of array
+            indices. All channels if None.
+        dtype : numpy dtype
+            dtype of the returned array. Integer dtypes such as np.uint16
+            are filled in blocks and raise OverflowError if a count does
+            not fit.
+
+        Returns
+        -------
+        dataset : array
+            Spectra in shape (len(keys), channels)
+        """
+        dtype = np.dtype(dtype)
+        idx = self.spec_index
+        if keys is None:
+            positions = list(range(len(idx)))
+        else:
+            positions = [idx.position(key) for key in keys]
+        if len(positions) == 0:
+            return np.zeros((0, 0), dtype=dtype)
+        start, text = idx.read_range(positions)
+
+        mca_starts = []
+        mca_texts = []
+        for match in _MCA_PATTERN.finditer(text):
+            mca_starts.append(start + match.start())
+            mca_texts.append(match.group(1))
+        scan_of_mca = np.searchsorted(idx.offsets, mca_starts,
+                                      side='right') - 1
+        first_mca = np.searchsorted(scan_of_mca, positions)
+        selected = first_mca + mca_no - 1
+
+        for position, mca in zip(positions, selected):
+            if (mca_no < 1 or mca >= len(mca_texts)
+                    or scan_of_mca[mca] != position):
+                raise IOError("MCA {} not found in scan {}".format(
+                    mca_no, idx.keys()[position]))
+
+        channel_match = _CHANN_PATTERN.search(text)
+        if channel_match is not None:
+            nchannels = int(channel_match.group(1))
+        else:
+            nchannels = len(
+                mca_texts[selected[0]].replace(b'\\', b' ').split())
+        if channels is None:
+            channels = slice(0, nchannels)
+        elif not isinstance(channels, slice):
+            channels = slice(*channels)
+        channels = slice(*channels.indices(nchannels))
+
+        tokens = b' '.join([mca_texts[mca] for mca in selected])
+        tokens = tokens.replace(b'\\', b' ').split()
+        if len(tokens) != len(positions) * nchannels:
+            raise ValueError("Spectra do not all have {} channels".format(
+                nchannels))
+
+        nselected = len(range(nchannels)[channels])
+        if nselected == nchannels:
+            selected_tokens = tokens
+        else:
+            selected_tokens = chain.from_iterable(
+                tokens[row + channels.start:row + channels.stop:channels.step]
+                for row in range(0, len(tokens), nchannels))
+        count = len(positions) * nselected
+        if dtype.kind == 'f':
+            dataset = np.fromiter(selected_tokens, dtype=dtype, count=count)
+        else:
+            dataset = np.empty(count, dtype=dtype)
+            selected_tokens = iter(selected_tokens)
+            for block_start in range(0, count, _COUNT_BLOCK):
+                size = min(_COUNT_BLOCK, count - block_start)
+                # counts may be written as 1.0, so read them as floats
+                block = np.fromiter(islice(selected_tokens, size),
+                                    dtype=np.float64, count=size)
+                dataset[block_start:block_start + size] = to_count_dtype(
+                    block, dtype)
+        return dataset.reshape(len(positions), nselected)
+
+    def columns(self, names, keys=None):
+        """Read a few #L columns from many scans
+
+        Only the requested columns of the data lines are converted to
+        floats. No header lines or spectra are decoded and no
+        dataobjects are built.
+
+        Parameters
+        ----------
+        names : string, integer or list of these
+            Column labels e.g. 'i2' or column numbers starting from 0
+        keys : list of strings or None
+            Scan keys. All scans if None.
+
+        Returns
+        -------
+        values : array
+            Points of all scans one after the other, in shape (points,)
+            for a single name or (points, len(names)) for a list
+        offsets : array
+            Points of scan i are values[offsets[i]:offsets[i + 1]]
+        """
+        single = not isinstance(names, (list, tuple))
+        if single:
+            names = [names]
+        idx = self.spec_index
+        if keys is None:
+            keys = idx.keys()
+        buffer = idx.buffer()
+        selected = []
+        for key in keys:
+            position = idx.position(key)
+            indices = column_indices(idx.labels[position], names, key)
+            with stage('source.parse', idx.lengths[position]):
+                if buffer is None:
+                    _, data, _ = parse_scan_block(idx.read_block(position),
+                                                  data_only=True,
+                                                  columns=indices)
+                else:
+                    start = idx.offsets[position]
+                    _, data, _ = parse_scan_block(
+                        buffer, start, start + idx.lengths[position],
+                        data_only=True, columns=indices)
+            selected.append(data)
+        offsets = np.zeros(len(selected) + 1, dtype=np.int64)
+        np.cumsum([len(values) for values in selected], out=offsets[1:])
+        if selected:
+            values = np.concatenate(selected)
+        else:
+            values = np.zeros((0, len(names)))
+        if single:
+            values = values[:, 0]
+        return values, offsets
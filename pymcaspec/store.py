@@ -0,0 +1,369 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from pymcaspec.headertable import x_temperatures
+from pymcaspec.specindex import SpecIndex
+from pymcaspec.specsource import (SOURCE_TYPE, SpecSource, column_indices,
+                                  to_count_dtype)
+
+
+STORE_VERSION = 1
+META_NAME = 'meta.json'
+# Elements per HDF5 chunk of the flat data and MCA arrays
+CHUNK_ELEMENTS = 1 << 16
+
+# Layout, the same for a .npy directory and an HDF5 file:
+# data        float64, the data of all scans raveled one after the other
+# data_index  int64 (scans, 3), start in data, rows and columns of a scan
+# mca         all MCA spectra one after the other
+# mca_index   int64 (spectra, 2), start in mca and channels of a spectrum
+# mca_first   int64 (scans + 1), spectra of scan i are
+#             mca_index[mca_first[i]:mca_first[i + 1]]
+# motors, count_time, hkl, pv  the header table
+# meta        json with keys, labels, commands and header text
+
+
+class _NpyWriter:
+    """Write arrays as .npy files in a directory"""
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._raw = {}
+
+    def save(self, name, array):
+        np.save(os.path.join(self.path, name + '.npy'), array)
+
+    def append(self, name, array, dtype):
+        if name not in self._raw:
+            self._raw[name] = (tempfile.TemporaryFile(dir=self.path),
+                               np.dtype(dtype), [0])
+        fh, dtype, count = self._raw[name]
+        fh.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+        count[0] += np.size(array)
+
+    def close(self, meta):
+        for name, (fh, dtype, count) in self._raw.items():
+            fh.seek(0)
+            with open(os.path.join(self.path, name + '.npy'), 'wb') as out:
+                np.lib.format.write_array_header_1_0(
+                    out, {'descr': np.lib.format.dtype_to_descr(dtype),
+                          'fortran_order': False, 'shape': (count[0],)})
+                shutil.copyfileobj(fh, out)
+            fh.close()
+        with open(os.path.join(self.path, META_NAME), 'w') as fh:
+            json.dump(meta, fh)
+
+
+class _Hdf5Writer:
+    """Write arrays as chunked datasets of an HDF5 file"""
+    def __init__(self, path):
+        import h5py
+        self._file = h5py.File(path, 'w')
+
+    def save(self, name, array):
+        self._file.create_dataset(name, data=array)
+
+    def append(self, name, array, dtype):
+        array = np.ravel(array)
+        if name not in self._file:
+            self._file.create_dataset(name, shape=(0,), dtype=dtype,
+                                      maxshape=(None,),
+                                      chunks=(CHUNK_ELEMENTS,))
+        dataset = self._file[name]
+        start = dataset.shape[0]
+        dataset.resize((start + array.size,))
+        dataset[start:] = array
+
+    def close(self, meta):
+        self._file.attrs['meta'] = json.dumps(meta)
+        self._file.close()
+
+
+def write_store(source, path, format='npy', mca_dtype=np.float64):
+    """Convert a spec file to a binary store
+
+    Scans are converted one at a time so memory use does not grow
+    with the file.
+
+    Parameters
+    ----------
+    source : SpecSource
+        The native source of the spec file
+    path : string
+        Directory for format 'npy' or file for format 'hdf5'
+    format : string
+        'npy' or 'hdf5', which requires h5py
+    mca_dtype : numpy dtype
+        dtype of the stored MCA counts e.g. np.uint16. See get_MCA.
+    """
+    if format == 'npy':
+        writer = _NpyWriter(path)
+    elif format == 'hdf5':
+        writer = _Hdf5Writer(path)
+    else:
+        raise ValueError("format must be 'npy' or 'hdf5'")
+
+    idx = source.spec_index
+    keys = idx.keys()
+    file_info = source._get_file_info()
+    data_index = np.zeros((len(keys), 3), dtype=np.int64)
+    mca_index = []
+    mca_first = np.zeros(len(keys) + 1, dtype=np.int64)
+    scan_headers = []
+    data_size = mca_size = 0
+    writer.append('data', np.zeros(0), np.float64)
+    writer.append('mca', np.zeros(0), mca_dtype)
+    for position, key in enumerate(keys):
+        info, data, mcas = source._get_scan(key, file_info=file_info)
+        scan_headers.append(info['Header'])
+        data_index[position] = data_size, data.shape[0], data.shape[1]
+        writer.append('data', data, np.float64)
+        data_size += data.size
+        for mca in mcas:
+            values = to_count_dtype(source._mca_values(mca), mca_dtype)
+            mca_index.append((mca_size, values.size))
+            writer.append('mca', values, mca_dtype)
+            mca_size += values.size
+        mca_first[position + 1] = len(mca_index)
+
+    table = source.header_table(keys)
+    pv_names = list(table['PV'])
+    writer.save('data_index', data_index)
+    writer.save('mca_index',
+                np.array(mca_index, dtype=np.int64).reshape(-1, 2))
+    writer.save('mca_first', mca_first)
+    writer.save('motors', table['motors'])
+    writer.save('count_time', table['count_time'])
+    writer.save('hkl', table['hkl'])
+    writer.save('pv', np.array([table['PV'][name] for name in pv_names]
+                               ).reshape(len(pv_names), len(keys)).T)
+    meta = {'version': STORE_VERSION,
+            'source': source.sourceName,
+            'numbers': list(idx.numbers),
+            'orders': list(idx.orders),
+            'npoints': list(idx.npoints),
+            'nmca': list(idx.nmca),
+            'commands': list(idx.commands),
+            'labels': [list(labels) for labels in idx.labels],
+            'header_ids': list(idx.header_ids),
+            'headers': idx.headers,
+            'scan_headers': scan_headers,
+            'motor_names': table['motor_names'],
+            'pv_names': pv_names,
+            'date': table['date'].tolist(),
+            'X': table['X'].tolist()}
+    writer.close(meta)
+
+
+class StoreSource(SpecSource):
+    """Source reading a store written by write_store
+
+    It has the interface of SpecSource. Arrays of a .npy directory are
+    memory-mapped and those of an HDF5 file are read on demand, so
+    nothing is parsed and loading a scan reads only that scan.
+    """
+    def __init__(self, path):
+        """Open a store
+
+        Parameters
+        ----------
+        path : string
+            Directory of .npy files or HDF5 file
+        """
+        self.sourceName = path
+        self.sourceType = SOURCE_TYPE
+        self.index_cache = False
+        self.cache_dir = None
+        if os.path.isdir(path):
+            # meta.json is written last, so it identifies the store
+            self.data_file = os.path.join(path, META_NAME)
+            with open(self.data_file) as fh:
+                meta = json.load(fh)
+            self._file = None
+            self._arrays = {}
+            for name in os.listdir(path):
+                if name.endswith('.npy'):
+                    array_path = os.path.join(path, name)
+                    try:
+                        array = np.load(array_path, mmap_mode='r')
+                    except ValueError:
+                        # empty arrays cannot be memory-mapped
+                        array = np.load(array_path)
+                    self._arrays[name[:-4]] = array
+        else:
+            import h5py
+            self.data_file = path
+            self._file = h5py.File(path, 'r')
+            meta = json.loads(self._file.attrs['meta'])
+            self._arrays = dict(self._file.items())
+        if meta['version'] != STORE_VERSION:
+            raise ValueError("{} has store version {}, expected {}".format(
+                path, meta['version'], STORE_VERSION))
+        self.meta = meta
+
+        spec_index = SpecIndex(path, build=False)
+        for field in ('numbers', 'orders', 'npoints', 'nmca', 'commands',
+                      'labels', 'header_ids', 'headers'):
+            setattr(spec_index, field, meta[field])
+        spec_index.rebuild_lookup()
+        self.spec_index = spec_index
+        # small arrays are read into memory
+        for name in ('data_index', 'mca_index', 'mca_first', 'motors',
+                     'count_time', 'hkl', 'pv'):
+            self._arrays[name] = np.asarray(self._arrays[name][()])
+
+    def refresh(self):
+        """A store does not change
+
+        Returns
+        -------
+        changed_keys : list
+            Always empty
+        """
+        return []
+
+    def close(self):
+        """Close the HDF5 file or the memory maps of the .npy files
+
+        The store cannot be read afterwards.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for name in ('data', 'mca'):
+            self._arrays.pop(name, None)
+
+    def _read_scan(self, position):
+        start, rows, cols = self._arrays['data_index'][position].tolist()
+        data = self._arrays['data'][start:start + rows * cols]
+        data = np.asarray(data).reshape(rows, cols)
+        mca_index = self._arrays['mca_index']
+        first, last = self._arrays['mca_first'][position:position + 2]
+        mcas = [self._arrays['mca'][start:start + size]
+                for start, size in mca_index[first:last].tolist()]
+        return self.meta['scan_headers'][position], data, mcas
+
+    def get_scan_header(self, key):
+        """Stored header lines of a scan"""
+        return self.meta['scan_headers'][self.spec_index.position(key)]
+
+    @staticmethod
+    def _mca_values(mca):
+        return np.asarray(mca, dtype=np.float64)
+
+    def get_data_objects(self, keys, workers=1):
+        """Load many scans. Nothing is parsed so workers is ignored.
+
+        Parameters
+        ----------
+        keys : list of strings
+            Scan keys 'scan.order'
+        workers : integer or None
+            Ignored
+
+        Returns
+        -------
+        dataobjects : list of DataObject
+            One per key in the order of keys
+        """
+        file_info = self._get_file_info()
+        return [self._make_data_object(*self._get_scan(key,
+                                                       file_info=file_info))
+                for key in keys]
+
+    def header_table(self, keys=None):
+        """Stored header table of the scans
+
+        Parameters
+        ----------
+        keys : list of strings or None
+            Scan keys. All scans if None.
+
+        Returns
+        -------
+        table : dict
+            See pymcaspec.headertable.header_table_from_lines
+        """
+        if keys is None:
+            keys = self.spec_index.keys()
+        positions = [self.spec_index.position(key) for key in keys]
+        pv = self._arrays['pv'][positions]
+        motor_names = list(self.meta['motor_names'])
+        xs = np.array(self.meta['X'], dtype=str)[positions]
+        TB, TA = x_temperatures(xs)
+        return {'keys': list(keys),
+                'date': np.array(self.meta['date'], dtype=str)[positions],
+                'count_time': self._arrays['count_time'][positions],
+                'hkl': self._arrays['hkl'][positions],
+                'X': xs,
+                'TB': TB,
+                'TA': TA,
+                'PV': {name: pv[:, i]
+                       for i, name in enumerate(self.meta['pv_names'])},
+                'motor_names': motor_names,
+                'motor_columns': {name: i
+                                  for i, name in enumerate(motor_names)},
+                'motors': self._arrays['motors'][positions]}
+
+    def columns(self, names, keys=None):
+        """Read a few #L columns from many scans
+
+        See SpecSource.columns
+        """
+        single = not isinstance(names, (list, tuple))
+        if single:
+            names = [names]
+        idx = self.spec_index
+        if keys is None:
+            keys = idx.keys()
+        selected = []
+        for key in keys:
+            position = idx.position(key)
+            indices = column_indices(idx.labels[position], names, key)
+            _, data, _ = self._read_scan(position)
+            selected.append(data[:, indices])
+        offsets = np.zeros(len(selected) + 1, dtype=np.int64)
+        np.cumsum([len(values) for values in selected], out=offsets[1:])
+        if selected:
+            values = np.concatenate(selected)
+        else:
+            values = np.zeros((0, len(names)))
+        if single:
+            values = values[:, 0]
+        return values, offsets
+
+    def get_mca_array(self, keys=None, mca_no=1, channels=None,
+                      dtype=np.float64):
+        """Read one stored MCA spectrum from each of many scans
+
+        See SpecSource.get_mca_array
+        """
+        dtype = np.dtype(dtype)
+        idx = self.spec_index
+        if keys is None:
+            keys = idx.keys()
+        if len(keys) == 0:
+            return np.zeros((0, 0), dtype=dtype)
+        if channels is None:
+            channels = slice(None)
+        elif not isinstance(channels, slice):
+            channels = slice(*channels)
+        mca_first = self._arrays['mca_first']
+        mca_index = self._arrays['mca_index']
+        spectra = []
+        for key in keys:
+            position = idx.position(key)
+            mca = mca_first[position] + mca_no - 1
+            if mca_no < 1 or mca >= mca_first[position + 1]:
+                raise IOError("MCA {} not found in scan {}".format(mca_no,
+                                                                   key))
+            start, size = mca_index[mca].tolist()
+            spectrum = np.asarray(self._arrays['mca'][start:start + size])
+            spectra.append(spectrum[channels])
+        if len({len(spectrum) for spectrum in spectra}) != 1:
+            raise ValueError("Spectra do not all have the same channels")
+        return to_count_dtype(np.array(spectra), dtype)
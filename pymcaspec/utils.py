@@ -1,5 +1,7 @@
 import numpy as np
 
+from pymcaspec.instrument import timed
+
 
 def get_T_ISR(scan_inst):
     """ISR specific function to read the temperature.
@@ -17,9 +19,7 @@ def get_T_ISR(scan_inst):
         The A temperature sensor
     """
     TB, TA = [], []
-    for dataobject in scan_inst.dataobjects:
-        header = dataobject.info['Header']
-        lineX = [line for line in header if '#X' in line][0]
+    for lineX in scan_inst.header_table()['X']:
         tb, ta = lineX.split(' ')[1:4:2]
         TB.append(float(tb))
         TA.append(float(ta))
@@ -41,13 +41,8 @@ def get_merixE(F):
         All the merix energies
 
     """
-    def get_energy_val(key):
-        val = next(float(line[4:])
-                   for line in F.source.getDataObject(key).info['Header']
-                   if line[:3] == '#PV')
-        return val
-
-    merixE = np.array([get_energy_val(key) for key in F.keys()])
+    PV = F.header_table()['PV']
+    merixE = PV['merixE'] if 'merixE' in PV else next(iter(PV.values()))
     return merixE
 
 
@@ -77,6 +72,7 @@ def calculate_energy_per_pixel(d, R, energy_edge, mmsperchannel=50e-3):
     return energy_per_pixel
 
 
+@timed('utils.clean_mythen_data')
 def clean_mythen_data(mythen_dataset, min_chan, max_chan, threshold):
     """Set pixels to zero based on channel range and threshold
     Parameters
@@ -95,14 +91,35 @@ def clean_mythen_data(mythen_dataset, min_chan, max_chan, threshold):
     mythen_dataset  : array
         The data in shape (pixels,  channels) after cleaning
     """
-    indices = np.arange(1, mythen_dataset.shape[1] + 1)
-    choose = np.logical_or(indices < min_chan, indices > max_chan)
+    choose = ~channel_window(mythen_dataset.shape[1], min_chan, max_chan)
     mythen_dataset[:, choose] = 0
     mythen_dataset[:, choose] = 0
     mythen_dataset[mythen_dataset > threshold] = 0
     return mythen_dataset
 
 
+def channel_window(nchannels, min_chan, max_chan):
+    """Channels inside the window min_chan <= channel <= max_chan
+
+    Parameters
+    ---------
+    nchannels : integer
+        Number of channels. They are numbered from 1.
+    min_chan : integer
+        Minimum channel
+    max_chan : integer
+        Maximum channel
+
+    Returns
+    -------
+    keep : array
+        Boolean array of shape (nchannels,)
+    """
+    indices = np.arange(1, nchannels + 1)
+    return np.logical_and(indices >= min_chan, indices <= max_chan)
+
+
+@timed('utils.construct_E_M')
 def construct_E_M(central_Es, central_Ms, mythen_dataset,
                   magicchannel, energy_per_pixel):
     """Create energy and monitor values
@@ -145,10 +162,76 @@ def construct_E_M(central_Es, central_Ms, mythen_dataset,
     return E_dataset, M_dataset
 
 
+def _wide_dtype(array):
+    """Accumulation dtype: int64 for integer counts, else float64"""
+    if np.issubdtype(array.dtype, np.integer):
+        return np.int64
+    return np.float64
+
+
+@timed('utils.bin_indices')
+def bin_indices(E_all, bin_edges):
+    """Find the bin of each energy in one pass
+
+    Bins follow np.histogram: [left, right) except the last bin, which
+    includes its right edge. Evenly spaced bin_edges are handled with
+    arithmetic, other edges with a binary search.
+
+    Parameters
+    ---------
+    E_all : array
+        Energies
+    bin_edges : array
+        The energy bin edges, increasing
+
+    returns
+    -------
+    indices : array
+        Bin of each energy. Energies outside bin_edges or NaN get
+        len(bin_edges) - 1, i.e. one past the last bin.
+    """
+    bin_edges = np.asarray(bin_edges, dtype=np.float64)
+    nbins = len(bin_edges) - 1
+    widths = np.diff(bin_edges)
+    if nbins < 1 or np.any(widths < 0):
+        raise ValueError("bin_edges must increase monotonically")
+    first, last = bin_edges[0], bin_edges[-1]
+    E_all = np.asarray(E_all)
+    outside = ~((E_all >= first) & (E_all <= last))
+    step = (last - first) / nbins
+    if step > 0 and np.allclose(widths, step, rtol=1e-6, atol=0):
+        E_inside = np.where(outside, first, E_all)
+        indices = ((E_inside - first) / step).astype(np.intp)
+        np.clip(indices, 0, nbins - 1, out=indices)
+        # correct rounding so that the result matches searchsorted
+        indices -= E_inside < bin_edges[indices]
+        indices += ((E_inside >= bin_edges[indices + 1])
+                    & (indices < nbins - 1))
+    else:
+        indices = np.searchsorted(bin_edges, E_all, side='right') - 1
+        indices[E_all == last] = nbins - 1
+    indices[outside] = nbins
+    return indices
+
+
+def _bin_sum(indices, weights, nbins):
+    """Sum weights per bin dropping the overflow bin nbins"""
+    total = np.bincount(indices, weights=weights, minlength=nbins + 1)[:nbins]
+    if np.issubdtype(weights.dtype, np.integer):
+        total = total.astype(np.int64)
+    return total
+
+
+@timed('utils.bin_mythen')
 def bin_mythen(E_dataset, M_dataset, mythen_dataset,
-               bin_edges):
+               bin_edges, return_indices=False):
     """
     Bin the mythen data. np.NaN values will be ignored.
+    Integer data, e.g. from get_all_MCA(dtype=np.uint16), are binned
+    without conversion and summed as int64.
+
+    The bin of each pixel is found once and I, M and N are all summed
+    from it with np.bincount.
 
     Parameters
     ---------
@@ -160,46 +243,82 @@ def bin_mythen(E_dataset, M_dataset, mythen_dataset,
         as mythen_dataset
     mythen_dataset  : array
         The mythen data in shape (pixels,  channels)
+        Float or integer counts.
     bin_edges : array or None
         The energy bin edges for the binning
+    return_indices : bool
+        Also return the bin of each pixel for reuse
 
     returns
     -------
     E : array
         Energies coresonding to bin centers
     I : array
-        Intensities
+        Intensities. int64 for integer mythen_dataset.
     M : array
         Montior
     N : array
         Number of contributing mythen pixels
+    indices : array
+        Only if return_indices. Bin of each pixel of the raveled data,
+        len(bin_edges) - 1 for pixels that are ignored.
     """
     E_all = E_dataset.ravel()
     I_all = mythen_dataset.ravel()
     M_all = M_dataset.ravel()
 
-    keep_indices = np.logical_and.reduce([np.isfinite(E_all),
-                                          np.isfinite(I_all),
-                                          np.isfinite(M_all)])
+    nbins = len(bin_edges) - 1
+    indices = bin_indices(E_all, bin_edges)
+    # integer arrays cannot hold NaN so only float arrays are checked
+    for arr in (I_all, M_all):
+        if not np.issubdtype(arr.dtype, np.integer):
+            indices[~np.isfinite(arr)] = nbins
 
-    E_all = E_all[keep_indices]
-    I_all = I_all[keep_indices]
-    M_all = M_all[keep_indices]
+    I = _bin_sum(indices, I_all, nbins)
+    M = _bin_sum(indices, M_all, nbins)
+    N = np.bincount(indices[I_all > 0], minlength=nbins + 1)[:nbins]
 
-    I, _ = np.histogram(E_all, bins=bin_edges, weights=I_all)
-    M, _ = np.histogram(E_all, bins=bin_edges, weights=M_all)
-
-    N, _ = np.histogram(E_all[I_all > 0], bins=bin_edges)
-    
     E = (bin_edges[:-1] + bin_edges[1:])/2
+    if return_indices:
+        return E, I, M, N, indices
     return E, I, M, N
 
 
+def default_bin_edges(central_Es):
+    """Bin edges halfway between the energies of the readouts
+
+    Parameters
+    ----------
+    central_Es : array
+        The energy of the magicchannel for each mythen readout in keV
+
+    Returns
+    -------
+    bin_edges : array
+        One bin per readout, the outer bins as wide as the mean step
+    """
+    central_Es = np.asarray(central_Es)
+    step = np.mean(np.abs(np.diff(central_Es)))
+    full_E_range = np.concatenate([[central_Es.min() - step],
+                                   central_Es,
+                                   [central_Es.max() + step]])
+    return (full_E_range[:-1] + full_E_range[1:])/2
+
+
+@timed('utils.bin_RIXS')
 def bin_RIXS(central_Es, central_Ms, mythen_dataset,
              magicchannel, energy_per_pixel,
-             min_chan=-np.inf, max_chan=np.inf, threshold=np.inf, bin_edges=None):
+             min_chan=-np.inf, max_chan=np.inf, threshold=np.inf, bin_edges=None,
+             chunksize=256):
     """Create a RIXS spectrum from sector 27 data
 
+    The readouts are processed chunksize at a time. The energy of each
+    pixel is computed by broadcasting and the channel window and
+    threshold are applied as a mask, so mythen_dataset is not modified
+    and memory use scales with the chunk rather than the dataset.
+    mythen_dataset can be any array that supports slicing of rows,
+    such as np.memmap or an h5py dataset.
+
     Parameters
     ----------
     central_Es : array
@@ -215,13 +334,15 @@ def bin_RIXS(central_Es, central_Ms, mythen_dataset,
         Energy per Mythen channel in keV
     bin_edges : array or None
         The energy bin edges for the binning
-        If none it will be constructed based on the data.
+        If none they are made by default_bin_edges.
     min_chan : integer
         Minimum channel -- those below this are set to zero
     max_chan : integer
         Minimum channel -- those below this are set to zero
     threshold : float
         set values above this to zero
+    chunksize : integer or None
+        Number of readouts binned at a time. All at once if None.
 
 
     returns
@@ -233,20 +354,313 @@ def bin_RIXS(central_Es, central_Ms, mythen_dataset,
     M : array
         Montior
     """
+    central_Es = np.asarray(central_Es)
+    central_Ms = np.asarray(central_Ms)
     if bin_edges is None:
-        step = np.mean(np.abs(np.diff(central_Es)))
-        full_E_range = np.concatenate([[central_Es.min() - step],
-                                       central_Es,
-                                       [central_Es.max() + step]])
-        
-        bin_edges = (full_E_range[:-1] + full_E_range[1:])/2
+        bin_edges = default_bin_edges(central_Es)
+
+    nreadouts, nchannels = mythen_dataset.shape
+    outside = ~channel_window(nchannels, min_chan, max_chan)
+    pixel_offsets = energy_per_pixel*(magicchannel
+                                      - np.arange(1, nchannels + 1))
+    if chunksize is None:
+        chunksize = max(nreadouts, 1)
+
+    I = M = N = 0
+    for start in range(0, nreadouts, chunksize):
+        stop = min(start + chunksize, nreadouts)
+        chunk = np.asarray(mythen_dataset[start:stop])
+        chunk = np.where(outside | (chunk > threshold), 0, chunk)
+        E_chunk = pixel_offsets + central_Es[start:stop, np.newaxis]
+        monitor_chunk = np.broadcast_to(central_Ms[start:stop, np.newaxis],
+                                        chunk.shape)
+        E, I_chunk, M_chunk, N_chunk = bin_mythen(E_chunk, monitor_chunk,
+                                                  chunk, bin_edges)
+        I = I + I_chunk
+        M = M + M_chunk
+        N = N + N_chunk
+    if nreadouts == 0:
+        E, I, M, N = bin_mythen(np.zeros(0), np.zeros(0), np.zeros(0),
+                                bin_edges)
+    return E, I, M, N
 
-    mythen_dataset = clean_mythen_data(mythen_dataset,
-                                       min_chan, max_chan, threshold)
 
-    E_dataset, M_dataset = construct_E_M(central_Es, central_Ms,
-                                         mythen_dataset, magicchannel, energy_per_pixel)
+class RIXSBinner:
+    """Bin many mythen datasets that share the same energy grid
 
-    E, I, M, N = bin_mythen(E_dataset, M_dataset, mythen_dataset,
-                            bin_edges)
-    return E, I, M, N
+    The mapping of every pixel to its energy bin is worked out once as
+    a sparse operator, so binning a dataset is one matrix-vector
+    product for each of I, M and N. This suits repeat scans with the
+    same central_Es, magicchannel, energy_per_pixel, channel window
+    and bin_edges.
+
+    scipy.sparse is used when installed, otherwise the operator is
+    applied with np.bincount.
+    """
+    def __init__(self, central_Es, nchannels, magicchannel, energy_per_pixel,
+                 min_chan=-np.inf, max_chan=np.inf, bin_edges=None,
+                 split_pixels=False):
+        """Precompute the binning operator
+
+        Parameters
+        ----------
+        central_Es : array
+            The energy of the magicchannel for each mythen readout in keV
+        nchannels : integer
+            Number of mythen channels
+        magicchannel : float
+            The magic rerference channel on the mythen
+        energy_per_pixel  : float
+            Energy per Mythen channel in keV
+        min_chan : integer
+            Minimum channel -- those below this are set to zero
+        max_chan : integer
+            Minimum channel -- those below this are set to zero
+        bin_edges : array or None
+            The energy bin edges for the binning
+            If none they are made by default_bin_edges.
+        split_pixels : bool
+            Spread each channel over the energy range
+            energy +/- energy_per_pixel/2 and share it between the bins
+            it overlaps in proportion to the overlap.
+        """
+        central_Es = np.asarray(central_Es, dtype=np.float64)
+        if bin_edges is None:
+            bin_edges = default_bin_edges(central_Es)
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self.E = (self.bin_edges[:-1] + self.bin_edges[1:])/2
+        self.shape = (len(central_Es), nchannels)
+        self.split_pixels = split_pixels
+        nbins = len(self.bin_edges) - 1
+
+        E_dataset, _ = construct_E_M(central_Es, np.zeros(len(central_Es)),
+                                     np.empty((0, nchannels)),
+                                     magicchannel, energy_per_pixel)
+        if E_dataset.size == 0:
+            E_dataset = np.zeros(self.shape)
+        E_all = E_dataset.ravel()
+        pixels = np.arange(E_all.size)
+        if split_pixels:
+            half_width = abs(energy_per_pixel)/2
+            low = E_all - half_width
+            high = E_all + half_width
+            first = np.clip(np.searchsorted(self.bin_edges, low,
+                                            side='right') - 1, 0, nbins - 1)
+            last = np.clip(np.searchsorted(self.bin_edges, high,
+                                           side='left') - 1, 0, nbins - 1)
+            rows, cols, weights = [], [], []
+            for shift in range(int((last - first).max(initial=0)) + 1):
+                bins = np.minimum(first + shift, nbins - 1)
+                overlap = (np.minimum(high, self.bin_edges[bins + 1])
+                           - np.maximum(low, self.bin_edges[bins]))
+                use = (bins <= last) & (overlap > 0)
+                rows.append(bins[use])
+                cols.append(pixels[use])
+                weights.append(overlap[use]/(2*half_width))
+            rows = np.concatenate(rows)
+            cols = np.concatenate(cols)
+            weights = np.concatenate(weights)
+        else:
+            rows = bin_indices(E_all, self.bin_edges)
+            use = rows < nbins
+            rows, cols = rows[use], pixels[use]
+            weights = np.ones(len(rows))
+
+        # pixels outside the channel window count towards M only
+        self._channels = channel_window(nchannels, min_chan, max_chan)
+        in_window = np.tile(self._channels, self.shape[0])[cols]
+        self._all = self._operator(rows, cols, weights, nbins, E_all.size)
+        self._window = self._operator(rows[in_window], cols[in_window],
+                                      weights[in_window], nbins, E_all.size)
+        # M of a bin is the monitor of each readout times its pixels
+        self._readouts = self._operator(rows, cols // nchannels, weights,
+                                        nbins, self.shape[0])
+
+    @staticmethod
+    def _operator(rows, cols, weights, nbins, size):
+        try:
+            from scipy import sparse
+        except ImportError:
+            return rows, cols, weights, nbins
+        return sparse.csr_matrix((weights, (rows, cols)), shape=(nbins, size))
+
+    @staticmethod
+    def _apply(operator, vector):
+        if isinstance(operator, tuple):
+            rows, cols, weights, nbins = operator
+            return np.bincount(rows, weights=weights*vector[cols],
+                               minlength=nbins)
+        return operator @ vector
+
+    @timed('utils.RIXSBinner.bin')
+    def bin(self, central_Ms, mythen_dataset, threshold=np.inf):
+        """Bin a mythen dataset
+
+        Parameters
+        ----------
+        central_Ms : array
+            The monitor for each mythen readout
+        mythen_dataset  : array
+            The mythen data in shape (readouts,  channels), which must
+            match the central_Es and nchannels of the binner
+        threshold : float
+            Ignore values above this as if they were zero
+
+        returns
+        -------
+        E : array
+            Energies coresonding to bin centers
+        I : array
+            Intensities. int64 for integer mythen_dataset without
+            pixel splitting.
+        M : array
+            Montior
+        N : array
+            Number of contributing mythen pixels. Fractional with pixel
+            splitting.
+        """
+        mythen_dataset = np.asarray(mythen_dataset)
+        if mythen_dataset.shape != self.shape:
+            raise ValueError("mythen_dataset has shape {} but the binner "
+                             "was built for {}".format(mythen_dataset.shape,
+                                                       self.shape))
+        central_Ms = np.asarray(central_Ms, dtype=np.float64)
+        I_all = mythen_dataset.ravel()
+        I_all = np.where(I_all > threshold, 0, I_all)
+        M = self._apply(self._readouts, central_Ms)
+        if not np.issubdtype(I_all.dtype, np.integer):
+            finite = np.isfinite(I_all)
+            if not finite.all():
+                # as bin_RIXS: non-finite pixels in the channel window are
+                # left out of I, M and N, those outside count towards M
+                bad = ~finite.reshape(self.shape) & self._channels
+                I_all = np.where(finite, I_all, 0)
+                M = M - self._apply(self._all, bad.ravel()*np.repeat(
+                    central_Ms, self.shape[1]))
+        I = self._apply(self._window, I_all.astype(np.float64))
+        N = self._apply(self._window, (I_all > 0).astype(np.float64))
+        if not self.split_pixels:
+            N = np.rint(N).astype(np.int64)
+            if np.issubdtype(I_all.dtype, np.integer):
+                I = np.rint(I).astype(np.int64)
+        return self.E, I, M, N
+
+
+class RIXSAccumulator:
+    """Running RIXS spectrum on a fixed energy grid
+
+    Readouts are binned as they arrive and partial results, e.g. from
+    several scans or worker processes, are combined with merge.
+    Instances can be pickled.
+    """
+    def __init__(self, bin_edges, magicchannel, energy_per_pixel,
+                 min_chan=-np.inf, max_chan=np.inf, threshold=np.inf):
+        """Start an empty spectrum
+
+        Parameters
+        ----------
+        bin_edges : array
+            The energy bin edges for the binning
+        magicchannel : float
+            The magic rerference channel on the mythen
+        energy_per_pixel  : float
+            Energy per Mythen channel in keV
+        min_chan : integer
+            Minimum channel -- those below this are set to zero
+        max_chan : integer
+            Minimum channel -- those below this are set to zero
+        threshold : float
+            set values above this to zero
+        """
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self.magicchannel = magicchannel
+        self.energy_per_pixel = energy_per_pixel
+        self.min_chan = min_chan
+        self.max_chan = max_chan
+        self.threshold = threshold
+        nbins = len(self.bin_edges) - 1
+        self.E = (self.bin_edges[:-1] + self.bin_edges[1:])/2
+        self.I = np.zeros(nbins, dtype=np.int64)
+        self.M = np.zeros(nbins)
+        self.N = np.zeros(nbins, dtype=np.int64)
+        self.n_readouts = 0
+
+    def add(self, central_E, central_M, readout):
+        """Add one mythen readout
+
+        Parameters
+        ----------
+        central_E : float
+            The energy of the magicchannel in keV
+        central_M : float
+            The monitor
+        readout : array
+            The mythen data in shape (channels,)
+        """
+        self.add_many([central_E], [central_M],
+                      np.asarray(readout)[np.newaxis, :])
+
+    @timed('utils.RIXSAccumulator.add_many')
+    def add_many(self, central_Es, central_Ms, mythen_dataset):
+        """Add several mythen readouts
+
+        Parameters
+        ----------
+        central_Es : array
+            The energy of the magicchannel for each mythen readout in keV
+        central_Ms : array
+            The monitor for each mythen readout
+        mythen_dataset  : array
+            The mythen data in shape (readouts,  channels)
+        """
+        _, I, M, N = bin_RIXS(central_Es, central_Ms, mythen_dataset,
+                              self.magicchannel, self.energy_per_pixel,
+                              min_chan=self.min_chan, max_chan=self.max_chan,
+                              threshold=self.threshold,
+                              bin_edges=self.bin_edges)
+        self.I = self.I + I
+        self.M = self.M + M
+        self.N = self.N + N
+        self.n_readouts += len(mythen_dataset)
+
+    def merge(self, other):
+        """Add the spectrum of another accumulator to this one
+
+        Parameters
+        ----------
+        other : RIXSAccumulator
+            Partial result with the same bin_edges and settings
+
+        Returns
+        -------
+        self : RIXSAccumulator
+            This accumulator, updated
+        """
+        settings = ('magicchannel', 'energy_per_pixel', 'min_chan',
+                    'max_chan', 'threshold')
+        if (not np.array_equal(self.bin_edges, other.bin_edges)
+                or any(getattr(self, name) != getattr(other, name)
+                       for name in settings)):
+            raise ValueError("Cannot merge spectra with different "
+                             "bin_edges or settings")
+        self.I = self.I + other.I
+        self.M = self.M + other.M
+        self.N = self.N + other.N
+        self.n_readouts += other.n_readouts
+        return self
+
+    def result(self):
+        """The spectrum so far
+
+        returns
+        -------
+        E : array
+            Energies coresonding to bin centers
+        I : array
+            Intensities
+        M : array
+            Montior
+        N : array
+            Number of contributing mythen pixels
+        """
+        return self.E, self.I.copy(), self.M.copy(), self.N.copy()
@@ -8,5 +8,9 @@ setup(name='pymcaspec',
       author_email='mdean@bnl.gov',
       packages=['pymcaspec'],
       license='MIT',
-      requires=['numpy', 'matplotlib', 'PyMca5'],
+      requires=['numpy'],
+      extras_require={'plot': ['matplotlib'], 'pymca': ['PyMca5'],
+                      'hdf5': ['h5py']},
+      entry_points={'console_scripts': [
+          'pymcaspec-rixsmap = pymcaspec.rixsmap:main']},
       zip_safe=False)
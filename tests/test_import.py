@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Optional dependencies a plain import pymcaspec must not load
+HEAVY_MODULES = ['matplotlib', 'PyMca5', 'scipy', 'h5py']
+# Generous budget for import pymcaspec, which takes about 0.1 s
+MAX_IMPORT_SECONDS = 2.0
+
+
+def run_fresh(code):
+    """JSON printed by code run in a new interpreter"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    output = subprocess.run([sys.executable, '-c', code], env=env,
+                            check=True, capture_output=True,
+                            text=True).stdout
+    return json.loads(output)
+
+
+def test_import_does_not_load_optional_dependencies():
+    modules = run_fresh(
+        'import json, sys\n'
+        'import pymcaspec\n'
+        'import pymcaspec.pymcaspec, pymcaspec.utils, pymcaspec.rixsmap\n'
+        'print(json.dumps(sorted(sys.modules)))')
+    loaded = {name.split('.')[0] for name in modules}
+    assert loaded.isdisjoint(HEAVY_MODULES), loaded & set(HEAVY_MODULES)
+
+
+def test_import_time():
+    seconds = run_fresh('import json, time\n'
+                        'start = time.perf_counter()\n'
+                        'import pymcaspec\n'
+                        'print(json.dumps(time.perf_counter() - start))')
+    assert seconds < MAX_IMPORT_SECONDS
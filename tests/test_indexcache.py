@@ -0,0 +1,41 @@
+import os
+import shutil
+import stat
+
+import numpy as np
+
+from pymcaspec.indexcache import cache_path
+from pymcaspec.specsource import SpecSource
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'examples', '20March2018')
+
+
+def copy_example(tmp_path):
+    path = str(tmp_path / '20March2018')
+    shutil.copyfile(EXAMPLE, path)
+    os.chmod(path, 0o644)
+    return path
+
+
+def test_cache_has_mode_of_spec_file(tmp_path):
+    path = copy_example(tmp_path)
+    SpecSource(path)
+    assert stat.S_IMODE(os.stat(cache_path(path)).st_mode) == 0o644
+
+
+def test_cached_header_table(tmp_path):
+    path = copy_example(tmp_path)
+    SpecSource(path)
+    cached = SpecSource(path)
+    assert cached.spec_index.header_table is not None
+    parsed = SpecSource(path, index_cache=False)
+    keys = parsed.spec_index.keys()[3:60:4]
+    expected = parsed.header_table(keys)
+    table = cached.header_table(keys)
+    assert table['keys'] == keys
+    for name in ('date', 'X', 'count_time', 'hkl', 'motors'):
+        np.testing.assert_array_equal(table[name], expected[name])
+    assert table['motor_columns'] == expected['motor_columns']
+    for name, values in expected['PV'].items():
+        np.testing.assert_array_equal(table['PV'][name], values)
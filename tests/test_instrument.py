@@ -0,0 +1,53 @@
+import os
+import threading
+
+import numpy as np
+
+from pymcaspec.instrument import record
+from pymcaspec.pymcaspec import specfile
+from pymcaspec.utils import bin_mythen
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'examples', '20March2018')
+
+
+def test_stats_of_stages():
+    F = specfile(EXAMPLE, index_cache=False, instrument=True)
+    S = F[440:447]
+    S.index('i2')
+    F['447.1']
+    F.columns('i2', keys=['440.1'])
+    stats = F.stats()
+    for name in ('specfile.open', 'specfile.load_many', 'specfile.index',
+                 'source.parse', 'scan.index', 'specfile.columns'):
+        assert stats[name]['calls'] > 0, name
+    assert stats['scan.index']['calls'] == 1
+    assert stats['source.parse']['bytes'] > 0
+
+    with F.recording():
+        bin_mythen(np.arange(4.), np.ones(4), np.ones(4),
+                   np.array([0., 2, 4]))
+    assert F.stats(reset=True)['utils.bin_mythen']['calls'] == 1
+    assert F.stats() == {}
+
+
+def test_stats_of_other_files_and_threads():
+    F = specfile(EXAMPLE, index_cache=False, instrument=True)
+    G = specfile(EXAMPLE, index_cache=False, instrument=True)
+    H = specfile(EXAMPLE, index_cache=False)
+    F.stats(reset=True)
+    G.columns('i2')
+    with F.recording():
+        H.columns('i2')
+        H['440.1'].index('i2')
+        thread = threading.Thread(target=lambda: G.columns('i2'))
+        thread.start()
+        thread.join()
+    assert F.stats() == {}
+    assert G.stats()['specfile.columns']['calls'] == 2
+
+    with record() as recorder:
+        thread = threading.Thread(target=lambda: H.columns('i2'))
+        thread.start()
+        thread.join()
+    assert recorder.stats()['specfile.columns']['calls'] == 1
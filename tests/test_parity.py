@@ -0,0 +1,97 @@
+"""The native source must read spec files as PyMca does"""
+import os
+
+import numpy as np
+import pytest
+
+from pymcaspec import specfile
+from pymcaspec.specsource import SpecSource
+
+SpecFileDataSource = pytest.importorskip(
+    'PyMca5.PyMcaCore.SpecFileDataSource').SpecFileDataSource
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'examples')
+EXAMPLE_FILES = ['20March2018', '20March2018.scan447.MYT', '20March2018.spm3']
+
+
+def load(source, key):
+    """Data and info of a scan, or the type of error loading it"""
+    try:
+        dataobject = source.getDataObject(key)
+    except TypeError as error:
+        return type(error), None
+    return dataobject.data, dataobject.info
+
+
+def assert_same_source(path):
+    pymca = SpecFileDataSource(path)
+    native = SpecSource(path, index_cache=False)
+    pymca_info = pymca.getSourceInfo()
+    native_info = native.getSourceInfo()
+    for name in ('KeyList', 'NumPts', 'NumMca'):
+        assert native_info[name] == pymca_info[name], name
+
+    for key in pymca_info['KeyList']:
+        pymca_data, pymca_scan = load(pymca, key)
+        native_data, native_scan = load(native, key)
+        if pymca_scan is None:
+            assert native_data is pymca_data, key
+            continue
+        np.testing.assert_array_equal(native_data, pymca_data, err_msg=key)
+        # PyMca adds an empty label for trailing spaces on the #L line
+        assert native_scan['LabelNames'] == [
+            name for name in pymca_scan['LabelNames'] if name], key
+        for name in ('Lines', 'NbMca', 'Command', 'MotorNames'):
+            assert native_scan[name] == pymca_scan[name], (key, name)
+        if pymca_scan['MotorNames']:
+            # without #O names PyMca reads #PS/#PV lines as motor values
+            assert native_scan['MotorValues'] == pymca_scan['MotorValues'], key
+        for mca in range(1, native_scan['NbMca'] + 1):
+            mca_key = '{}.{}'.format(key, mca)
+            np.testing.assert_array_equal(native._getMcaData(mca_key).data,
+                                          pymca._getMcaData(mca_key).data,
+                                          err_msg=mca_key)
+
+
+@pytest.mark.parametrize('name', EXAMPLE_FILES)
+def test_example_files(name):
+    assert_same_source(os.path.join(EXAMPLES, name))
+
+
+def test_header_table_backends():
+    path = os.path.join(EXAMPLES, '20March2018')
+    native = specfile(path, index_cache=False).header_table()
+    pymca = specfile(path, backend='pymca').header_table()
+    # 118.1 has no data points
+    assert not np.isnan(native['count_time'][native['keys'].index('118.1')])
+    for name, values in native.items():
+        if isinstance(values, np.ndarray):
+            np.testing.assert_array_equal(pymca[name], values, err_msg=name)
+        elif name == 'PV':
+            assert set(pymca[name]) == set(values)
+            for pv, pv_values in values.items():
+                np.testing.assert_array_equal(pymca[name][pv], pv_values)
+        else:
+            assert pymca[name] == values, name
+
+
+HEADER = '#F edge\n#E 1521480966\n#O0 m1  m2\n\n'
+SCAN = '#S {} ascan  m1 0 1  2 1\n#P0 1 2\n#N 2\n#L a  b\n'
+
+
+@pytest.mark.parametrize('body, expected', [
+    (' 1 2\n 3 4\n5 6\n', [[1, 2], [3, 4], [5, 6]]),
+    ('1 2\n\n3 4\n  \n5 6\n', [[1, 2], [3, 4], [5, 6]]),
+    ('1 2\n@A 1 2 3\\\n 4 5 6\n3 4\n@A 7 8 9\\\n 10 11 12\n',
+     [[1, 2], [3, 4]]),
+    ('1 2\n3 4\n5', [[1, 2], [3, 4]]),
+], ids=['leading whitespace', 'blank lines', 'mca continuation',
+        'truncated last line'])
+def test_edge_cases(tmp_path, body, expected):
+    path = str(tmp_path / 'edge')
+    with open(path, 'w') as fh:
+        fh.write(HEADER + SCAN.format(1) + '1 2\n\n' + SCAN.format(2) + body)
+    native = SpecSource(path, index_cache=False)
+    np.testing.assert_array_equal(native.getDataObject('2.1').data, expected)
+    assert_same_source(path)
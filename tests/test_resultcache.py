@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+
+from pymcaspec.resultcache import ResultCache
+
+
+def test_eviction_order(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    for number, name in enumerate('abc'):
+        cache.put(name, np.full(100, number))
+        os.utime(cache._path(name), ns=(number + 1, number + 1))
+    assert cache.get('a')[0]
+    size = cache.stats()['bytes'] // 3
+    cache.max_bytes = 2 * size
+    cache.put('d', np.full(100, 3))
+    # b and c are the least recently used after a was read
+    assert not os.path.exists(cache._path('b'))
+    assert not os.path.exists(cache._path('c'))
+    np.testing.assert_array_equal(cache.get('a')[1], np.full(100, 0))
+    np.testing.assert_array_equal(cache.get('d')[1], np.full(100, 3))
+    assert cache.evictions == 2
+
+
+def test_stats(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=10**6)
+    assert not cache.get('a')[0]
+    cache.put('a', (np.arange(3), np.ones(2)))
+    found, result = cache.get('a')
+    assert found and isinstance(result, tuple) and len(result) == 2
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+    assert stats['evictions'] == 0 and stats['entries'] == 1
+    assert stats['bytes'] == os.path.getsize(cache._path('a'))
+    assert stats['max_bytes'] == 10**6
+
+
+def test_hit_when_the_time_cannot_be_set(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    cache.put('a', np.arange(3))
+
+    def utime(*args, **kwargs):
+        raise PermissionError
+
+    monkeypatch.setattr(os, 'utime', utime)
+    found, result = cache.get('a')
+    assert found
+    np.testing.assert_array_equal(result, np.arange(3))
+
+
+def test_memoize(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    calls = []
+
+    def reduce(path, scale=1):
+        calls.append((path, scale))
+        with open(path) as fh:
+            return np.array([float(fh.read()) * scale])
+
+    path = str(tmp_path / 'value')
+    with open(path, 'w') as fh:
+        fh.write('2')
+    memoized = cache.memoize(reduce, file_args=['path'])
+    assert memoized(path) == 2
+    assert memoized(path, scale=1) == 2
+    assert len(calls) == 1
+    assert memoized(path, scale=3) == 6
+    assert len(calls) == 2
+    with open(path, 'w') as fh:
+        fh.write('50')
+    assert memoized(path) == 50
+    assert len(calls) == 3
@@ -0,0 +1,22 @@
+import pytest
+
+from pymcaspec.rixsmap import build_rixs_map, reduce_myt_file
+
+READOUT = ('#S {0} mythen_save Point:{1} Scan:1 Datafile:stem\n'
+           '#PN merixE\n#PV {2}\n#@CHANN 4 0 3 1\n#L sec  i2\n{3}'
+           '@A 1 5 9 2\n\n')
+
+
+def test_readout_without_data(tmp_path):
+    path = str(tmp_path / 'stem.scan1.MYT')
+    with open(path, 'w') as fh:
+        fh.write('#F stem\n#E 1521480966\n\n'
+                 + READOUT.format(1, 0, 8.334, '20 1000\n')
+                 + READOUT.format(2, 1, 8.335, ''))
+    with pytest.raises(ValueError, match='2.1'):
+        reduce_myt_file(path, 2, 1e-3, [8.333, 8.3345, 8.3355, 8.336])
+
+
+def test_no_scans(tmp_path):
+    with pytest.raises(ValueError):
+        build_rixs_map(str(tmp_path / 'stem'), [], 2, 1e-3)
@@ -0,0 +1,169 @@
+import os
+
+import numpy as np
+import pytest
+
+from pymcaspec.pymcaspec import specfile
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'examples')
+
+
+def write(tmp_path, text, name='spec'):
+    path = str(tmp_path / name)
+    with open(path, 'w') as fh:
+        fh.write(text)
+    return path
+
+
+def temperature_file(tmp_path):
+    scans = ''.join(
+        '#S {} ascan  Chi 0 1  1 1\n#X {} K {}\n#P0 {}\n#L Chi  i2\n'
+        '0 1\n1 2\n\n'.format(number, TB, TA, chi)
+        for number, TB, TA, chi in [(1, 10.02, 10.51, 11),
+                                    (2, 25.0, 25.4, 11),
+                                    (3, 15.5, 16.0, 30)])
+    return write(tmp_path, '#F t\n#E 1521480966\n#O0 Chi\n\n' + scans)
+
+
+def test_select_on_temperature(tmp_path):
+    F = specfile(temperature_file(tmp_path), index_cache=False)
+    table = F.header_table()
+    np.testing.assert_array_equal(table['TB'], [10.02, 25.0, 15.5])
+    np.testing.assert_array_equal(table['TA'], [10.51, 25.4, 16.0])
+    assert F.select(command='ascan', Chi=(10, 12), TB=(None, 20)) == ['1.1']
+    assert F.select(TA=(16, None)) == ['2.1', '3.1']
+
+
+def test_columns_match_scans():
+    F = specfile(os.path.join(EXAMPLES, '20March2018'), index_cache=False)
+    keys = ['116.1', '117.1', '118.1', '119.1']
+    values, offsets = F.columns(['i2', 0], keys=keys)
+    assert np.diff(offsets).tolist() == [21, 21, 0, 11]
+    for key, start, stop in zip(keys, offsets[:-1], offsets[1:]):
+        if start == stop:
+            continue
+        S = F[key]
+        np.testing.assert_array_equal(values[start:stop, 0], S['i2'])
+        np.testing.assert_array_equal(values[start:stop, 1], S[0])
+
+
+def test_scan_columns_are_views_of_one_block():
+    F = specfile(os.path.join(EXAMPLES, '20March2018'), index_cache=False)
+    dataobjects = [F.index(key) for key in ['116.1', '117.1']]
+    expected = np.concatenate([d.data[:, 0] for d in dataobjects])
+    S = F._scan(dataobjects)
+    I = S[0]
+    np.testing.assert_array_equal(I, expected)
+    assert all(np.shares_memory(I, d.data) for d in S.dataobjects)
+    I /= 2
+    np.testing.assert_array_equal(S[0], expected / 2)
+    np.testing.assert_array_equal(
+        np.concatenate([d.data[:, 0] for d in S.dataobjects]), expected / 2)
+
+
+def test_result_cache_with_npy_store(tmp_path):
+    from pymcaspec.resultcache import ResultCache
+
+    F = specfile(os.path.join(EXAMPLES, '20March2018.scan447.MYT'),
+                 index_cache=False)
+    store = str(tmp_path / 'store')
+    F.to_npy(store)
+    cache = ResultCache(str(tmp_path / 'cache'))
+    for _ in range(2):
+        G = specfile(store, backend='store', result_cache=cache)
+        np.testing.assert_array_equal(G.get_all_MCA(), F.get_all_MCA())
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_close():
+    with specfile(os.path.join(EXAMPLES, '20March2018'),
+                  index_cache=False) as F:
+        S = F[440:442]
+        spec_index = F.source.spec_index
+        assert spec_index._map is not None
+    assert spec_index._map is None
+    np.testing.assert_array_equal(F[440:442]['i2'], S['i2'])
+    F.close()
+
+
+def test_fancy_indexing():
+    F = specfile(os.path.join(EXAMPLES, '20March2018'), index_cache=False)
+    keys = F.keys()
+    S = F[F.header_table()['count_time'] == 20]
+    assert [d.info['Key'] for d in S.dataobjects] == [
+        '446.1', '447.1', '451.1', '454.1', '456.1']
+    assert [d.info['Key'] for d in F[-3:].dataobjects] == keys[-3:]
+    assert [d.info['Key'] for d in F[np.array([5, 7])].dataobjects] == [
+        '5.1', '7.1']
+    with pytest.raises(IndexError, match='1000'):
+        F[[5, 1000, 1001]]
+
+
+@pytest.mark.parametrize('prefetch', [0, 3])
+@pytest.mark.parametrize('chunksize', [None, 4])
+def test_iter_scans(prefetch, chunksize):
+    F = specfile(os.path.join(EXAMPLES, '20March2018'), index_cache=False)
+    keys = F.keys()[110:130]
+    npoints = dict(zip(F.keys(), F.source.getSourceInfo()['NumPts']))
+    assert 0 in [npoints[key] for key in keys]
+    loaded = [F[key] for key in keys if npoints[key]]
+    scans = list(F.iter_scans(keys, prefetch=prefetch, chunksize=chunksize))
+    dataobjects = [d for S in scans for d in S.dataobjects]
+    assert [d.info['Key'] for d in dataobjects] == [
+        S.dataobjects[0].info['Key'] for S in loaded]
+    for dataobject, S in zip(dataobjects, loaded):
+        np.testing.assert_array_equal(dataobject.data, S.dataobjects[0].data)
+    if chunksize:
+        assert [len(S.dataobjects) for S in scans] == [4, 4, 4, 4, 3]
+
+
+def test_load_many_workers():
+    F = specfile(os.path.join(EXAMPLES, '20March2018'), index_cache=False)
+    keys = ['440.1', 441, '442', '447.1']
+    serial = F.load_many(keys, workers=1)
+    parallel = F.load_many(keys, workers=2)
+    assert ([d.info['Key'] for d in parallel.dataobjects]
+            == [d.info['Key'] for d in serial.dataobjects]
+            == ['440.1', '441.1', '442.1', '447.1'])
+    for name in serial.dataobjects[0].info['LabelNames']:
+        np.testing.assert_array_equal(parallel[name], serial[name])
+    assert parallel.get_baseline('Theta') == serial.get_baseline('Theta')
+
+
+def test_plot_collection():
+    matplotlib = pytest.importorskip('matplotlib')
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    F = specfile(os.path.join(EXAMPLES, '20March2018'), index_cache=False)
+    S = F[440:447]
+    leg, art, ax = S.plot_collection(ykey='i2')
+    assert isinstance(art, LineCollection)
+    assert len(art.get_segments()) == len(S.dataobjects) == 7
+    assert len(leg.get_texts()) == 7
+    for segment, single in zip(art.get_segments(), S):
+        np.testing.assert_array_equal(segment[:, 0], single[0])
+        np.testing.assert_array_equal(segment[:, 1], single['i2'])
+
+    leg, art, ax = S.plot_collection(max_points=10, color_by='Theta')
+    assert len(art.get_segments()) == 7
+    assert all(len(segment) <= 10 for segment in art.get_segments())
+    np.testing.assert_array_equal(art.get_array(), S.get_baseline('Theta'))
+    plt.close('all')
+
+
+def test_compact_records_match_dataobjects():
+    path = os.path.join(EXAMPLES, '20March2018')
+    F = specfile(path, index_cache=False)
+    C = specfile(path, index_cache=False, compact=True)
+    npoints = dict(zip(F.keys(), F.source.getSourceInfo()['NumPts']))
+    keys = [key for key in F.keys()[::15] if npoints[key]]
+    for key in keys:
+        full, compact = F.index(key), C.index(key)
+        np.testing.assert_array_equal(compact.data, full.data, err_msg=key)
+        for name in ('LabelNames', 'MotorNames', 'MotorValues', 'Command',
+                     'Header'):
+            assert compact.info[name] == full.info[name], (key, name)
+        np.testing.assert_array_equal(C[key].get_hkl(), F[key].get_hkl())
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from pymcaspec import specfile
+from pymcaspec.specindex import SpecIndex
+
+FIELDS = ('numbers', 'orders', 'offsets', 'lengths', 'npoints', 'nmca',
+          'header_ids', 'commands', 'labels', 'headers', 'key_positions',
+          '_number_counts', 'size')
+
+HEADER = """#F grow
+#E 1521574000
+#D Tue Mar 20 14:00:00 2018
+#O0 Theta  Chi
+
+#S 1  ascan  Theta 0 1 2 1
+#D Tue Mar 20 14:01:00 2018
+#P0 10 20
+#@CHANN 4 0 3 1
+#L Theta  i2
+0 100
+0.5 1"""
+
+STEPS = [
+    # the partial data line is completed and a new scan is started
+    """01
+1 102
+
+#S 2  ascan  Theta 0 1 1 1
+#D Tue Mar 20 14:02:00 2018
+#P0 11 21
+#@CHANN 4 0 3 1
+#L Theta  i2
+0 99
+""",
+    # MCA spectra with a continuation split across the write
+    """@A 1 2 \\
+3 4
+1 98
+@A 5 6 \\
+""",
+    """7 8
+
+#S 3  ascan  Theta 0 1 1 1
+""",
+]
+
+
+def assert_same_index(index, path):
+    expected = SpecIndex(path)
+    for name in FIELDS:
+        assert getattr(index, name) == getattr(expected, name), name
+
+
+@pytest.mark.parametrize('index_cache', [False, True])
+def test_refresh_matches_new_index(tmp_path, index_cache):
+    path = str(tmp_path / 'grow')
+    with open(path, 'w') as fh:
+        fh.write(HEADER)
+    F = specfile(path, index_cache=index_cache)
+    assert_same_index(F.source.spec_index, path)
+    for text in STEPS:
+        with open(path, 'a') as fh:
+            fh.write(text)
+        F.refresh()
+        assert_same_index(F.source.spec_index, path)
+        if index_cache:
+            G = specfile(path)
+            assert_same_index(G.source.spec_index, path)
+            G.close()
+    assert F.keys() == ['1.1', '2.1', '3.1']
+    np.testing.assert_array_equal(F.get_MCA('2.1.1'), [1, 2, 3, 4])
+    np.testing.assert_array_equal(F.get_MCA('2.1.2'), [5, 6, 7, 8])
+    F.close()
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from pymcaspec.specsource import SpecSource
+
+
+def write(tmp_path, text, name='spec'):
+    path = str(tmp_path / name)
+    with open(path, 'w') as fh:
+        fh.write(text)
+    return path
+
+
+MCA_FILE = ('#F mca\n#E 1521480966\n\n'
+            '#S 1 mythen_save\n#@CHANN 4 0 3 1\n@A 1.0 2.0\\\n 3 4.0\n\n'
+            '#S 2 mythen_save\n#@CHANN 4 0 3 1\n@A 5 6 7 8\n')
+
+
+def test_integer_counts_written_as_floats(tmp_path):
+    source = SpecSource(write(tmp_path, MCA_FILE), index_cache=False)
+    dataset = source.get_mca_array(dtype=np.uint16)
+    assert dataset.dtype == np.uint16
+    np.testing.assert_array_equal(dataset, [[1, 2, 3, 4], [5, 6, 7, 8]])
+
+
+def test_fractional_counts_are_not_integers(tmp_path):
+    path = write(tmp_path, MCA_FILE.replace('2.0', '2.5'))
+    source = SpecSource(path, index_cache=False)
+    with pytest.raises(ValueError):
+        source.get_mca_array(dtype=np.uint16)
+
+
+COLUMN_FILE = '#F columns\n#E 1521480966\n\n#S 1 ascan\n#L a  b  c\n'
+
+
+@pytest.mark.parametrize('body', [
+    '1 2 3\n4 5 6\n7 8 9\n',
+    '  1.5e3 -2 nan\n\t4 +5 .6\n7 8 9',
+    '1 2 3\n4 5\n7 8 9\n',
+], ids=['plain', 'formats', 'short line'])
+def test_columns_match_data(tmp_path, body):
+    source = SpecSource(write(tmp_path, COLUMN_FILE + body),
+                        index_cache=False)
+    data = source.getDataObject('1.1').data
+    values, offsets = source.columns(['c', 'a'])
+    np.testing.assert_array_equal(values, data[:, [2, 0]])
+    np.testing.assert_array_equal(offsets, [0, len(data)])
+
+
+def test_columns_bad_value(tmp_path):
+    source = SpecSource(write(tmp_path, COLUMN_FILE + '1 2 3\n4 5 x\n'),
+                        index_cache=False)
+    with pytest.raises(ValueError):
+        source.getDataObject('1.1')
+    with pytest.raises(ValueError):
+        source.columns('c')
+    # the other columns are not converted
+    np.testing.assert_array_equal(source.columns('a')[0], [1, 4])
+
+
+def test_columns_of_wide_scan(tmp_path, monkeypatch):
+    # small pieces so that the scan is read in several
+    monkeypatch.setattr('pymcaspec.specsource._COLUMN_PIECE', 1000)
+    values = np.random.default_rng(0).uniform(0, 1e6, (2000, 40))
+    path = str(tmp_path / 'wide')
+    with open(path, 'w') as fh:
+        fh.write(COLUMN_FILE.replace(
+            'a  b  c', '  '.join('c{}'.format(i) for i in range(40))))
+        np.savetxt(fh, values, fmt='%.6g')
+    source = SpecSource(path, index_cache=False)
+    data = source.getDataObject('1.1').data
+    np.testing.assert_array_equal(source.columns('c3')[0], data[:, 3])
+    np.testing.assert_array_equal(source.columns([39, 0])[0],
+                                  data[:, [39, 0]])
@@ -0,0 +1,167 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from pymcaspec.utils import (RIXSAccumulator, RIXSBinner, bin_indices,
+                             bin_mythen, bin_RIXS, clean_mythen_data,
+                             construct_E_M, default_bin_edges)
+
+UNIFORM = np.linspace(0, 1, 11)
+IRREGULAR = np.array([0, 0.05, 0.2, 0.21, 0.5, 0.9, 1])
+
+
+def energies(bin_edges):
+    """Every edge, points between them and points outside"""
+    rng = np.random.default_rng(0)
+    return np.concatenate([bin_edges, rng.uniform(-0.2, 1.2, 500),
+                           [-1, 2, np.nan]])
+
+
+@pytest.mark.parametrize('bin_edges', [UNIFORM, IRREGULAR],
+                         ids=['uniform', 'irregular'])
+def test_bin_indices_match_histogram(bin_edges):
+    E = energies(bin_edges)
+    indices = bin_indices(E, bin_edges)
+    nbins = len(bin_edges) - 1
+    for i, energy in enumerate(E):
+        counts, _ = np.histogram([energy], bin_edges)
+        expected = np.flatnonzero(counts)
+        assert indices[i] == (expected[0] if len(expected) else nbins), energy
+
+
+@pytest.mark.parametrize('bin_edges', [UNIFORM, IRREGULAR],
+                         ids=['uniform', 'irregular'])
+@pytest.mark.parametrize('dtype', [np.float64, np.int64])
+def test_bin_mythen_matches_histogram(bin_edges, dtype):
+    E = energies(bin_edges)
+    rng = np.random.default_rng(1)
+    I = rng.integers(0, 5, len(E)).astype(dtype)
+    M = rng.uniform(1, 2, len(E))
+    if dtype == np.float64:
+        I[::7] = np.nan
+    finite = np.isfinite(I) & np.isfinite(E)
+    E_out, I_out, M_out, N_out = bin_mythen(E.reshape(-1, 1), M.reshape(-1, 1),
+                                            I.reshape(-1, 1), bin_edges)
+    np.testing.assert_allclose(E_out, (bin_edges[:-1] + bin_edges[1:])/2)
+    np.testing.assert_allclose(
+        I_out, np.histogram(E[finite], bin_edges, weights=I[finite])[0])
+    np.testing.assert_allclose(
+        M_out, np.histogram(E[finite], bin_edges, weights=M[finite])[0])
+    np.testing.assert_array_equal(
+        N_out, np.histogram(E[finite & (I > 0)], bin_edges)[0])
+    if dtype == np.int64:
+        assert I_out.dtype == np.int64
+
+
+def readouts(dtype=np.float64, nan=False):
+    """central_Es, central_Ms and a mythen dataset of 45 readouts"""
+    rng = np.random.default_rng(2)
+    central_Es = np.linspace(8.334, 8.336, 45)
+    central_Ms = rng.uniform(1e6, 2e6, 45)
+    mythen_dataset = rng.poisson(3, (45, 200)).astype(dtype)
+    if nan:
+        mythen_dataset[::4, ::9] = np.nan
+    return central_Es, central_Ms, mythen_dataset
+
+
+def old_bin_RIXS(central_Es, central_Ms, mythen_dataset, magicchannel,
+                 energy_per_pixel, min_chan, max_chan, threshold, bin_edges):
+    """bin_RIXS as it was before the readouts were binned in chunks"""
+    E_dataset, M_dataset = construct_E_M(central_Es, central_Ms,
+                                         mythen_dataset, magicchannel,
+                                         energy_per_pixel)
+    cleaned = clean_mythen_data(mythen_dataset.copy(), min_chan, max_chan,
+                                threshold)
+    return bin_mythen(E_dataset, M_dataset, cleaned, bin_edges)
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 45, 256, None])
+@pytest.mark.parametrize('dtype, nan', [(np.float64, False),
+                                        (np.float64, True),
+                                        (np.uint16, False)],
+                         ids=['float', 'nan', 'integer'])
+def test_chunked_bin_RIXS(chunksize, dtype, nan):
+    central_Es, central_Ms, mythen_dataset = readouts(dtype, nan)
+    settings = dict(magicchannel=100.5, energy_per_pixel=2e-5, min_chan=20,
+                    max_chan=180, threshold=6)
+    step = np.mean(np.diff(central_Es))
+    bin_edges = np.arange(8.330, 8.340, step)
+    result = bin_RIXS(central_Es, central_Ms, mythen_dataset,
+                      bin_edges=bin_edges, chunksize=chunksize, **settings)
+    expected = old_bin_RIXS(central_Es, central_Ms, mythen_dataset,
+                            bin_edges=bin_edges, **settings)
+    for value, expected_value in zip(result, expected):
+        np.testing.assert_allclose(value, expected_value, rtol=1e-12)
+    if dtype == np.uint16:
+        assert result[1].dtype == np.int64
+    np.testing.assert_array_equal(mythen_dataset,
+                                  readouts(dtype, nan)[2])
+
+
+@pytest.mark.parametrize('split_pixels', [False, True])
+@pytest.mark.parametrize('nan', [False, True])
+def test_binner_matches_bin_RIXS(split_pixels, nan):
+    central_Es, central_Ms, mythen_dataset = readouts(nan=nan)
+    # NaN pixels both inside and outside the channel window
+    assert np.isnan(mythen_dataset[:, :20]).any() == nan
+    assert np.isnan(mythen_dataset[:, 20:180]).any() == nan
+    step = np.mean(np.diff(central_Es))
+    bin_edges = np.arange(8.330, 8.340, step)
+    binner = RIXSBinner(central_Es, 200, 100.5, 2e-5, min_chan=20,
+                        max_chan=180, bin_edges=bin_edges,
+                        split_pixels=split_pixels)
+    E, I, M, N = binner.bin(central_Ms, mythen_dataset, threshold=6)
+    expected = bin_RIXS(central_Es, central_Ms, mythen_dataset, 100.5, 2e-5,
+                        min_chan=20, max_chan=180, threshold=6,
+                        bin_edges=bin_edges)
+    np.testing.assert_allclose(E, expected[0])
+    if split_pixels:
+        # the pixels are shared between bins, keeping the totals
+        for value, expected_value in zip((I, M, N), expected[1:]):
+            np.testing.assert_allclose(value.sum(), expected_value.sum(),
+                                       rtol=1e-9)
+    else:
+        for value, expected_value in zip((I, M, N), expected[1:]):
+            np.testing.assert_allclose(value, expected_value, rtol=1e-12)
+
+
+def test_default_bin_edges():
+    central_Es, central_Ms, mythen_dataset = readouts()
+    bin_edges = default_bin_edges(central_Es)
+    assert len(bin_edges) == len(central_Es) + 1
+    np.testing.assert_allclose((bin_edges[:-1] + bin_edges[1:])/2,
+                               central_Es)
+    E = bin_RIXS(central_Es, central_Ms, mythen_dataset, 100.5, 2e-5)[0]
+    np.testing.assert_array_equal(E, (bin_edges[:-1] + bin_edges[1:])/2)
+    binner = RIXSBinner(central_Es, 200, 100.5, 2e-5)
+    np.testing.assert_array_equal(binner.bin_edges, bin_edges)
+
+
+@pytest.mark.parametrize('dtype, nan', [(np.float64, True),
+                                        (np.uint16, False)],
+                         ids=['nan', 'integer'])
+def test_accumulator_matches_bin_RIXS(dtype, nan):
+    central_Es, central_Ms, mythen_dataset = readouts(dtype, nan)
+    settings = dict(magicchannel=100.5, energy_per_pixel=2e-5, min_chan=20,
+                    max_chan=180, threshold=6)
+    bin_edges = default_bin_edges(central_Es)
+    expected = bin_RIXS(central_Es, central_Ms, mythen_dataset,
+                        bin_edges=bin_edges, **settings)
+
+    first = RIXSAccumulator(bin_edges, **settings)
+    for i in range(10):
+        first.add(central_Es[i], central_Ms[i], mythen_dataset[i])
+    first.add_many(central_Es[10:20], central_Ms[10:20],
+                   mythen_dataset[10:20])
+    second = RIXSAccumulator(bin_edges, **settings)
+    second.add_many(central_Es[20:], central_Ms[20:], mythen_dataset[20:])
+    second = pickle.loads(pickle.dumps(second))
+    result = first.merge(second).result()
+    assert first.n_readouts == 45
+    for value, expected_value in zip(result, expected):
+        np.testing.assert_allclose(value, expected_value, rtol=1e-12)
+
+    restored = pickle.loads(pickle.dumps(first)).result()
+    for value, expected_value in zip(restored, result):
+        np.testing.assert_array_equal(value, expected_value)